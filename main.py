@@ -1,48 +1,140 @@
 from src.task.intent_handler import IntentHandler
 from src.task.dataset_helpers import load_data, print_dataset_stats
+from src.task.prompt_templates import preference_to_str
 import os
 import argparse
-import json
 from datetime import datetime
-from pathlib import Path
 from src.utils.call_llm_helpers import create_model_caller
+from src.utils.response_cache import configure_response_cache, get_response_cache, DEFAULT_CACHE_PATH
+from src.utils.result_writer import ResultWriter
 from global_user_intents import GLOBAL_GUIDELINES
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
-def save_results(results: dict, output_dir: str = "synthesized", num_samples: int = 1):
-   """Save results to JSON files"""
-   # Create output directory if it doesn't exist
-   Path(output_dir).mkdir(parents=True, exist_ok=True)
-  
-   # Generate timestamp for unique filenames
-   timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-  
-   # Save each task's results in a separate file
-   for task, task_results in results.items():
-       # Group results by dataset
-       dataset_results = {}
-       for result in task_results:
-           dataset = result["dataset"]
-           if dataset not in dataset_results:
-               dataset_results[dataset] = []
-           dataset_results[dataset].append(result)
-      
-       # Save each dataset's results in a separate file
-       for dataset, dataset_data in dataset_results.items():
-           filename = f"{output_dir}/{task}_{dataset}_samples{num_samples}_{timestamp}.json"
-           with open(filename, 'w', encoding='utf-8') as f:
-               json.dump(dataset_data, f, indent=2, ensure_ascii=False)
-           print(f"Saved results to {filename}")
+def make_result(dataset_name, user_id, example, dataset_guideline, base_prompt, edit_prompt,
+                base_output, edit_output, base_model, edit_model) -> dict:
+   """Build the result record stored for one (user, example) pair"""
+   # Convert user preferences to a single string
+   user_pref_str = preference_to_str(example.user_pref)
+   return {
+       "dataset": dataset_name,
+       "user_id": user_id,
+       "article_id": example.id,
+       "article_preview": f"{example.article[:100]}...{example.article[-100:]}",
+       "dataset_guideline": dataset_guideline,
+       "user_preference": user_pref_str,
+       "base_prompt": base_prompt,
+       "edit_prompt": edit_prompt,
+       "base_output": base_output,
+       "edit_output": edit_output,
+       "base_model": base_model,
+       "edit_model": edit_model,
+       "timestamp": datetime.now().isoformat()
+   }
+
+
+def strip_base_prompt(base_output, base_prompt):
+   """Remove base_prompt from the start of base_output (None stays None), as the per-example loop does."""
+   if base_output is not None and base_output.startswith(base_prompt):
+       return base_output[len(base_prompt):].strip()
+   return base_output
+
+
+def run_stage(model_caller, prompts: list, batch_size: int, concurrency: int, desc: str, on_output=None) -> list:
+   """Run one generation stage over all prompts.
+
+   Prompts are split into chunks of `batch_size`, each chunk is sent through
+   `model_caller.batch`, and up to `concurrency` chunks are in flight at once.
+   Outputs are returned in the order of `prompts` (None where a call failed);
+   `on_output(i, output)` is also called for each prompt as soon as its chunk finishes.
+   """
+   if batch_size <= 0 or concurrency <= 0:
+       raise ValueError(f"batch_size and concurrency must be positive, got {batch_size} and {concurrency}")
+   outputs = [None] * len(prompts)
+   chunks = [list(range(start, min(start + batch_size, len(prompts))))
+             for start in range(0, len(prompts), batch_size)]
+   pbar = tqdm(total=len(prompts), desc=desc)
+   with ThreadPoolExecutor(max_workers=concurrency) as executor:
+       futures = {executor.submit(model_caller.batch, [prompts[i] for i in chunk]): chunk for chunk in chunks}
+       for future in as_completed(futures):
+           chunk = futures[future]
+           try:
+               for i, output in zip(chunk, future.result()):
+                   outputs[i] = output
+                   if on_output is not None:
+                       on_output(i, output)
+           except Exception as e:
+               print(f"Error processing batch in {desc}: {str(e)}")
+           pbar.update(len(chunk))
+   pbar.close()
+   return outputs
 
 
-def main(test_mode: bool = False, test_samples: int = 1, base_model: str = "microsoft/Phi-4-mini-instruct", edit_model: str = "gpt-4o-mini"):
+def run_pipeline(handler, task: str, dataset_name: str, dataset, base_model_caller, edit_model_caller,
+                 base_model: str, edit_model: str, writer: ResultWriter, completed: set = frozenset(),
+                 base_batch_size: int = 8, base_concurrency: int = 1,
+                 edit_batch_size: int = 16, edit_concurrency: int = 8) -> int:
+   """Stage-batched synthesis for one dataset: all base generations first, then all edits.
+
+   Splitting the two stages lets the local base model decode full batches and
+   the API edit model keep many requests in flight, instead of the two
+   backends taking turns on every example. Records are written as soon as
+   their edit finishes; failed edits are not written, so `--resume` retries them.
+   Examples whose key is in `completed` are skipped.
+   Returns the number of records written.
+   """
+   task_instance = handler._get_task(task, dataset_name)
+   dataset_guideline = GLOBAL_GUIDELINES.get(task, {}).get(dataset_name, "")
+   items = [(user_id, example)
+            for user_id in dataset.get_unique_users()
+            for example in dataset.get_examples_by_user(user_id)
+            if (dataset_name, user_id, example.id) not in completed]
+
+   # Stage 1: Generate base outputs for every example
+   base_prompts = task_instance.get_base_prompts((example.article for _, example in items), dataset_name)
+   base_outputs = run_stage(base_model_caller, base_prompts, base_batch_size, base_concurrency,
+                            desc=f"Base stage ({dataset_name})")
+   base_outputs = [strip_base_prompt(base_output, base_prompt)
+                   for base_output, base_prompt in zip(base_outputs, base_prompts)]
+
+   # Stage 2: Edit every base output that was generated successfully
+   done = [i for i, base_output in enumerate(base_outputs) if base_output is not None]
+   edit_prompts = task_instance.get_edit_prompts_batch(
+       (items[i][1].article for i in done), (base_outputs[i] for i in done),
+       (items[i][1].user_pref for i in done), dataset_name)
+   written = 0
+   def write_result(j, edit_output):
+       nonlocal written
+       if edit_output is None:
+           return
+       written += 1
+       i = done[j]
+       user_id, example = items[i]
+       writer.write(task, make_result(
+           dataset_name, user_id, example, dataset_guideline,
+           base_prompts[i], edit_prompts[j], base_outputs[i], edit_output,
+           base_model, edit_model))
+
+   run_stage(edit_model_caller, edit_prompts, edit_batch_size, edit_concurrency,
+             desc=f"Edit stage ({dataset_name})", on_output=write_result)
+   if hasattr(edit_model_caller, "latency_stats"):
+       print(f"Edit stage latency (s): {edit_model_caller.latency_stats()}")
+   return written
+
+
+def main(test_mode: bool = False, test_samples: int = 1, base_model: str = "microsoft/Phi-4-mini-instruct", edit_model: str = "gpt-4o-mini",
+         pipeline: bool = False, base_batch_size: int = 8, base_concurrency: int = 1,
+         edit_batch_size: int = 16, edit_concurrency: int = 8, output_dir: str = "synthesized", resume: bool = False,
+         device: str = "auto", dtype: str = "auto", quantize: str = None, num_threads: int = None,
+         prompt_layout: str = "article_first"):
    # Create model callers for both stages
-   base_model_caller = create_model_caller(base_model)  # First stage: Base model
+   base_model_caller = create_model_caller(base_model, device=device, dtype=dtype, quantize=quantize,
+                                           num_threads=num_threads)  # First stage: Base model
    edit_model_caller = create_model_caller(edit_model)  # Second stage: Edit model
   
    # Initialize intent handler with the edit model
-   handler = IntentHandler(edit_model_caller)
+   handler = IntentHandler(edit_model_caller, prompt_layout=prompt_layout)
   
    # Define tasks and their datasets
    tasks = {
@@ -50,8 +142,8 @@ def main(test_mode: bool = False, test_samples: int = 1, base_model: str = "micr
        # "email_writing": ['slf5k']
    }
   
-   # Store results for each task
-   results = {task: [] for task in tasks.keys()}
+   # Stream results to per-task/per-dataset JSONL files as they finish
+   writer = ResultWriter(output_dir, num_samples=test_samples if test_mode else 100, resume=resume)
   
    # Calculate total examples to process
    total_examples = sum(len(datasets) * test_samples for datasets in tasks.values())
@@ -67,7 +159,18 @@ def main(test_mode: bool = False, test_samples: int = 1, base_model: str = "micr
            # Load dataset with multiple users
            num_examples = test_samples if test_mode else 100
            dataset = load_data(dataset_name, num_ex=num_examples, num_users=5)  # Use all 5 users
+           # Examples already written by an earlier run (only with resume)
+           completed = writer.completed_keys(task, dataset_name)
           
+           if pipeline:
+               run_pipeline(
+                   handler, task, dataset_name, dataset, base_model_caller, edit_model_caller,
+                   base_model, edit_model, writer, completed,
+                   base_batch_size=base_batch_size, base_concurrency=base_concurrency,
+                   edit_batch_size=edit_batch_size, edit_concurrency=edit_concurrency)
+               pbar.update(len(dataset))
+               continue
+
            # Get dataset guidelines
            dataset_guideline = GLOBAL_GUIDELINES.get(task, {}).get(dataset_name, "")
           
@@ -77,6 +180,9 @@ def main(test_mode: bool = False, test_samples: int = 1, base_model: str = "micr
                user_examples = dataset.get_examples_by_user(user_id)
               
                for example in user_examples:
+                   if (dataset_name, user_id, example.id) in completed:
+                       pbar.update(1)
+                       continue
                 #    print(f"\nArticle ID: {example.id}")
                 #    print(f"Article preview: {example.article[:100]}...")
                 #    print(f"User preference: {example.user_pref}")
@@ -87,7 +193,8 @@ def main(test_mode: bool = False, test_samples: int = 1, base_model: str = "micr
                       
                        # Stage 1: Generate base output using base model
                        base_prompt = task_instance.get_base_prompt(example.article, dataset_name)
-                       base_output = base_model_caller(base_prompt)
+                       base_prefix = task_instance.get_base_prompt_prefix(dataset_name)
+                       base_output = base_model_caller(base_prompt, prefix=base_prefix) if base_prefix else base_model_caller(base_prompt)
                        if base_output.startswith(base_prompt): # Remove base_prompt from the base_output
                            base_output = base_output[len(base_prompt):].strip()
                     #    print(f"Base output:\n{base_output}")
@@ -108,33 +215,20 @@ def main(test_mode: bool = False, test_samples: int = 1, base_model: str = "micr
                     #    print(f"Base output:\n{base_output[:100]}...{base_output[-100:]}")
                     #    print(f"Edited output:\n{edit_output[:100]}...{edit_output[-100:]}\n{'='*50}\n")
                       
-                       # Convert user preferences to a single string
-                       user_pref_str = ", ".join(intent.value for intent in example.user_pref) if example.user_pref else ""
-                      
                        # Store the results with both outputs
-                       results[task].append({
-                           "dataset": dataset_name,
-                           "user_id": user_id,
-                           "article_id": example.id,
-                           "article_preview": f"{example.article[:100]}...{example.article[-100:]}",
-                           "dataset_guideline": dataset_guideline,
-                           "user_preference": user_pref_str,
-                           "base_prompt": base_prompt,
-                           "edit_prompt": edit_prompt,
-                           "base_output": base_output,
-                           "edit_output": edit_output,
-                           "base_model": base_model,
-                           "edit_model": edit_model,
-                           "timestamp": datetime.now().isoformat()
-                       })
+                       writer.write(task, make_result(
+                           dataset_name, user_id, example, dataset_guideline,
+                           base_prompt, edit_prompt, base_output, edit_output,
+                           base_model, edit_model))
                    except Exception as e:
                        print(f"Error processing: {str(e)}")
                    finally:
                        pbar.update(1)
   
    pbar.close()
-   # Save results to JSON files
-   save_results(results, num_samples=test_samples if test_mode else 100)
+   writer.close()
+   if get_response_cache() is not None:
+       print(f"Response cache: {get_response_cache().stats()}")
 
 
 if __name__ == "__main__":
@@ -144,12 +238,32 @@ if __name__ == "__main__":
     parser.add_argument('--base-model', type=str, default="meta-llama/Llama-3.1-8B-Instruct", help='Model name to use for base generation')
     parser.add_argument('--edit-model', type=str, default="gpt-4o-mini", help='Model name to use for editing')
     parser.add_argument('--output-dir', type=str, default="synthesized", help='Directory to save results')
+    parser.add_argument('--device', type=str, default="auto", help='Device for the base model: auto, cpu, cuda or cuda:N')
+    parser.add_argument('--dtype', type=str, default="auto", choices=['auto', 'fp16', 'bf16', 'fp32'], help='Weight dtype for the base model (auto: fp16 on GPU, fp32 on CPU)')
+    parser.add_argument('--quantize', type=str, default=None, choices=['int8'], help='Quantize the base model weights')
+    parser.add_argument('--num-threads', type=int, default=None, help='CPU threads used for base model inference')
+    parser.add_argument('--prompt-layout', type=str, default="article_first", choices=['article_first', 'static_first'], help='Put the article first, or the static guidelines/preferences first so prompts share a cacheable prefix')
+    parser.add_argument('--resume', action='store_true', help='Append to the latest output files and skip examples already in them')
+    parser.add_argument('--pipeline', action='store_true', help='Run all base generations first, then all edits, in batches')
+    parser.add_argument('--base-batch-size', type=int, default=8, help='Prompts per batch in the base stage (pipeline mode)')
+    parser.add_argument('--base-concurrency', type=int, default=1, help='Batches in flight in the base stage (pipeline mode)')
+    parser.add_argument('--edit-batch-size', type=int, default=16, help='Prompts per batch in the edit stage (pipeline mode)')
+    parser.add_argument('--edit-concurrency', type=int, default=8, help='Batches in flight in the edit stage (pipeline mode)')
+    parser.add_argument('--cache-path', type=str, default=DEFAULT_CACHE_PATH, help='SQLite file for the persistent LLM response cache')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the persistent LLM response cache')
     parser.add_argument('--show-stats', type=str, nargs='+', default=['cnn_dailymail'], help='Show statistics for one or more datasets (e.g., cnn_dailymail xsum slf5k)')
     args = parser.parse_args()
 
+    configure_response_cache(None if args.no_cache else args.cache_path)
+
     if args.show_stats:
         for dataset in args.show_stats:
             print_dataset_stats(dataset)
     
     main(test_mode=args.test_mode, test_samples=args.test_samples, 
-         base_model=args.base_model, edit_model=args.edit_model)
\ No newline at end of file
+         base_model=args.base_model, edit_model=args.edit_model,
+         pipeline=args.pipeline, base_batch_size=args.base_batch_size, base_concurrency=args.base_concurrency,
+         edit_batch_size=args.edit_batch_size, edit_concurrency=args.edit_concurrency,
+         output_dir=args.output_dir, resume=args.resume,
+         device=args.device, dtype=args.dtype, quantize=args.quantize, num_threads=args.num_threads,
+         prompt_layout=args.prompt_layout)
\ No newline at end of file
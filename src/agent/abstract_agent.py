@@ -23,10 +23,12 @@ class Agent(ABC):
         raise ValueError(f'You are not supposed to cheat with {self.__class__.__name__}')
     
     def metrics(self, message, correction: Correction):
-        correction.original = self._llm.get_logprobs(message, correction.original)
         if correction.is_edited():
-            correction.edited = self._llm.get_logprobs(message, correction.edited)
+            # Both completions share the message, so it is prefilled once and both are scored on top of it
+            correction.original, correction.edited = self._llm.get_logprobs_many(
+                message, [correction.original, correction.edited])
         else:
+            correction.original = self._llm.get_logprobs(message, correction.original)
             correction.edited = correction.original
         cost = self._task.cost(correction)
         print_color(f'cost: {cost}', color="red")
@@ -36,10 +38,10 @@ class Agent(ABC):
         return {
             'message': message,
             'completion': correction.original.text,
-            # 'completion_logprobs': correction.original.logprobs,
+            'completion_logprobs': correction.original.logprobs,
             'completion_token_count': correction.original.token_count,
             'edited': correction.edited.text,
-            # 'edited_logprobs': correction.edited.logprobs,
+            'edited_logprobs': correction.edited.logprobs,
             'edited_token_count': correction.edited.token_count,
             'cost': cost,
             'comment': correction.comment.text,
@@ -1,4 +1,5 @@
 from src.agent.abstract_agent import Agent
+from src.agent.encoders.embedding_store import DEFAULT_EMBEDDING_CACHE_DIR
 from src.agent.encoders.encoder_wrapper import EncoderWrapper
 from src.language_models.llm import LLMOutput
 from src.agent.rag import RAG
@@ -9,15 +10,23 @@ from typing import Dict
 class Cipher1Agent(Agent):
     def __init__(self, agent_config, task, workspace, encoder_type='bert'):
         # Create an encoder model to encode documents
-        encoder_model = EncoderWrapper().make_encoder(encoder_type)
+        cache_dir = getattr(agent_config, 'embedding_cache_dir', DEFAULT_EMBEDDING_CACHE_DIR)
+        encoder_model = EncoderWrapper().make_encoder(encoder_type, cache_dir=cache_dir)
         encode = lambda doc: encoder_model.encode(doc).view(-1)
-        self.rag = RAG(encode)
+        encode_batch = lambda docs: encoder_model.encode_batch(docs)
+        # Without an embedding store, RAG memoizes encodings itself
+        self.rag = RAG(encode, encode_batch, ann_threshold=getattr(agent_config, 'rag_ann_threshold', None),
+                       memo_size=None if cache_dir else RAG.DEFAULT_MEMO_SIZE)
         # Current doc
         self.rag_doc = None
 
         super().__init__(agent_config, task, workspace)
 
 
+    def pre_encode(self, docs):
+        # Encode a whole dataset split up front in length-bucketed batches
+        self.rag.precompute(docs)
+
     def complete(self, text) -> LLMOutput:
         if len(self.rag) > 0:
             closest_replay_doc_encoding, self.rag_doc, self._preference  = self.rag.get(text)[0]
@@ -38,9 +47,13 @@ class Cipher1Agent(Agent):
 class CipherNAgent(Agent):
     def __init__(self, agent_config, task, workspace, encoder_type='bert', icl_count=3):
         # Create an encoder model to encode documents
-        encoder_model = EncoderWrapper().make_encoder(encoder_type)
+        cache_dir = getattr(agent_config, 'embedding_cache_dir', DEFAULT_EMBEDDING_CACHE_DIR)
+        encoder_model = EncoderWrapper().make_encoder(encoder_type, cache_dir=cache_dir)
         encode = lambda doc: encoder_model.encode(doc).view(-1)
-        self.rag = RAG(encode)
+        encode_batch = lambda docs: encoder_model.encode_batch(docs)
+        # Without an embedding store, RAG memoizes encodings itself
+        self.rag = RAG(encode, encode_batch, ann_threshold=getattr(agent_config, 'rag_ann_threshold', None),
+                       memo_size=None if cache_dir else RAG.DEFAULT_MEMO_SIZE)
         self.icl_count = icl_count
         # Current doc
         self.rag_docs = None
@@ -49,6 +62,10 @@ class CipherNAgent(Agent):
         super().__init__(agent_config, task, workspace)
 
 
+    def pre_encode(self, docs):
+        # Encode a whole dataset split up front in length-bucketed batches
+        self.rag.precompute(docs)
+
     def complete(self, text) -> LLMOutput:
         if len(self.rag) > 0:
             _dp = self.rag.get(text, topk=self.icl_count)
@@ -1,11 +1,59 @@
+import torch
+
+
 class AbstractEncoder:
 
     def __init__(self):
         pass
 
+    # Subclasses set `_model_handle`, a shared (model, tokenizer) handle from the model registry,
+    # which is loaded on first access
+    @property
+    def model(self):
+        return self._model_handle.get()[0]
+
+    @property
+    def tokenizer(self):
+        return self._model_handle.get()[1]
+
     def encode(self, text):
         """
         :param text: the text in string that needs to be encoded
         :return: a single tensor 1-d that contains encoding of the text
         """
         raise NotImplementedError()
+
+    def _embed(self, texts):
+        """
+        :param texts: a string or a list of strings, encoded together as one padded batch
+        :return: a tensor batch x hidden_dim with one normalized encoding per text, on CPU
+        """
+        raise NotImplementedError()
+
+    def encode_batch(self, texts, max_tokens_per_batch=8192, max_length=512):
+        """
+        Encode many texts without building autograd graphs. Texts are sorted by token length and
+        grouped into batches of at most `max_tokens_per_batch` padded tokens, so batches waste
+        little compute on padding and peak memory stays bounded.
+        :param texts: list of strings
+        :return: a tensor len(texts) x hidden_dim, rows in the order of `texts`
+        """
+        if not texts:
+            return torch.empty(0)
+        lengths = [len(ids) for ids in self.tokenizer(list(texts), truncation=True, max_length=max_length)["input_ids"]]
+        # Longest first: the first text of a batch sets its padded length
+        order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+        batches, batch = [], []
+        for i in order:
+            if batch and (len(batch) + 1) * lengths[batch[0]] > max_tokens_per_batch:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        batches.append(batch)
+
+        results = [None] * len(texts)
+        with torch.inference_mode():
+            for batch in batches:
+                for i, encoding in zip(batch, self._embed([texts[i] for i in batch])):
+                    results[i] = encoding
+        return torch.stack(results)
@@ -3,6 +3,14 @@ import torch
 from transformers import AutoTokenizer
 from transformers import BertModel
 from src.agent.encoders.abstract_encoder import AbstractEncoder
+from src.utils.model_registry import get_model_registry
+
+
+def _load(device):
+    tokenizer = AutoTokenizer.from_pretrained("bert-base-uncased")
+    model = BertModel.from_pretrained("bert-base-uncased").to(device)
+    model.eval()
+    return model, tokenizer
 
 
 class BertEncoding(AbstractEncoder):
@@ -10,18 +18,19 @@ class BertEncoding(AbstractEncoder):
     def __init__(self):
 
         super(AbstractEncoder, self).__init__()
-        self.tokenizer = AutoTokenizer.from_pretrained("bert-base-uncased")
-        self.model = BertModel.from_pretrained("bert-base-uncased")
-
-        if torch.cuda.is_available():
-            self.device = "cuda"
-            self.model.cuda()
-        else:
-            self.device = "cpu"
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # One copy per process, shared by every agent using this encoder
+        self._model_handle = get_model_registry().acquire(
+            ("encoder", "bert-base-uncased", self.device, "fp32"), lambda device=self.device: _load(device), owner=self)
 
     def encode(self, text):
 
-        batch_token_ids = self.tokenizer(text,
+        with torch.inference_mode():
+            return self._embed(text)
+
+    def _embed(self, texts):
+
+        batch_token_ids = self.tokenizer(texts,
                                          padding="longest",
                                          return_tensors="pt",
                                          truncation=True,
@@ -38,7 +47,8 @@ class BertEncoding(AbstractEncoder):
 
         avg_masked_hidden_state = avg_masked_hidden_state.detach().cpu()
 
-        return avg_masked_hidden_state / torch.norm(avg_masked_hidden_state)
+        # Normalize each encoding separately so batching does not change the result
+        return avg_masked_hidden_state / torch.norm(avg_masked_hidden_state, dim=1, keepdim=True)
 
 
 if __name__ == '__main__':
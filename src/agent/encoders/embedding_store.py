@@ -0,0 +1,196 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from src.agent.encoders.abstract_encoder import AbstractEncoder
+
+# The on-disk store is opt-in: set EMBEDDING_CACHE_DIR (or pass agent_config.embedding_cache_dir)
+DEFAULT_EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR") or None
+
+_DIGEST_SIZE = 32
+
+
+class EmbeddingStore:
+    """
+    Persistent store of the encodings produced by one encoder, keyed by the SHA-256 of the text.
+
+    Encodings are appended as float32 rows to `vectors.f32` and read back through a memory map;
+    `keys.bin` holds the digest of each row in the same order. A bounded in-memory LRU sits in
+    front of the map. Appends take a file lock, so several processes can share one store, and
+    rows written by other processes are picked up on the next miss.
+    """
+
+    def __init__(self, root, encoder_name, lru_size=4096):
+        self.path = Path(root) / encoder_name
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._keys_path = self.path / "keys.bin"
+        self._vectors_path = self.path / "vectors.f32"
+        self._meta_path = self.path / "meta.json"
+        self._keys_path.touch()
+        self._vectors_path.touch()
+        self.dim = json.loads(self._meta_path.read_text())["dim"] if self._meta_path.exists() else None
+        self.lru_size = lru_size
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._keys_read = 0
+        self._mmap = None
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        with self._file_lock():
+            self._repair()
+        self._refresh()
+
+    @staticmethod
+    def digest(text):
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.path / ".lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _num_complete_rows(self):
+        num_keys = self._keys_path.stat().st_size // _DIGEST_SIZE
+        if self.dim is None:
+            return 0
+        return min(num_keys, self._vectors_path.stat().st_size // (4 * self.dim))
+
+    def _repair(self):
+        # A crash between the two appends leaves a vector without a key (or a torn row); drop it
+        rows = self._num_complete_rows()
+        os.truncate(self._keys_path, rows * _DIGEST_SIZE)
+        os.truncate(self._vectors_path, rows * 4 * (self.dim or 0))
+
+    def _refresh(self):
+        """Index rows appended since the last refresh (by this or another process)."""
+        if self.dim is None and self._meta_path.exists():
+            self.dim = json.loads(self._meta_path.read_text())["dim"]
+        rows = self._num_complete_rows()
+        if rows == self._keys_read:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_read * _DIGEST_SIZE)
+            data = f.read((rows - self._keys_read) * _DIGEST_SIZE)
+        for i in range(rows - self._keys_read):
+            self._rows[data[i * _DIGEST_SIZE:(i + 1) * _DIGEST_SIZE]] = self._keys_read + i
+        self._keys_read = rows
+        self._mmap = None
+
+    def _read_row(self, row):
+        if self._mmap is None or self._mmap.shape[0] <= row:
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._keys_read, self.dim))
+        return torch.from_numpy(np.array(self._mmap[row]))
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get(self, text):
+        """
+        :return: the stored 1-d encoding of `text`, or None
+        """
+        key = self.digest(text)
+        with self._lock:
+            if key in self._lru:
+                self.hits += 1
+                self._lru.move_to_end(key)
+                return self._lru[key]
+            if key not in self._rows:
+                self._refresh()
+            if key not in self._rows:
+                self.misses += 1
+                return None
+            self.hits += 1
+            vector = self._read_row(self._rows[key])
+            self._remember(key, vector)
+            return vector
+
+    def put_many(self, texts, vectors):
+        """
+        :param texts: list of strings
+        :param vectors: tensor len(texts) x dim with their encodings
+        """
+        vectors = vectors.detach().to(torch.float32).cpu().reshape(len(texts), -1)
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._meta_path.write_text(json.dumps({"dim": self.dim}))
+            new = [(self.digest(text), vector) for text, vector in zip(texts, vectors)]
+            new = [(key, vector) for key, vector in dict(new).items() if key not in self._rows]
+            if not new:
+                return
+            # Vectors first, keys last: a row only counts once its key is written
+            with open(self._vectors_path, "ab") as f:
+                f.write(np.stack([vector.numpy() for _, vector in new]).astype(np.float32).tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(key for key, _ in new))
+            for key, vector in new:
+                self._rows[key] = self._keys_read
+                self._keys_read += 1
+                self._remember(key, vector)
+            self._mmap = None
+
+    def put(self, text, vector):
+        self.put_many([text], vector.reshape(1, -1))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(encoder_name, root):
+    """Process-wide EmbeddingStore for an encoder, shared by every consumer of that encoder"""
+    with _stores_lock:
+        key = (str(Path(root).resolve()), encoder_name)
+        if key not in _stores:
+            _stores[key] = EmbeddingStore(root, encoder_name)
+        return _stores[key]
+
+
+class CachedEncoder(AbstractEncoder):
+    """Encoder that looks encodings up in an EmbeddingStore and only runs the model on misses."""
+
+    def __init__(self, encoder, store):
+        super(AbstractEncoder, self).__init__()
+        self.encoder = encoder
+        self.store = store
+
+    @property
+    def tokenizer(self):
+        return self.encoder.tokenizer
+
+    def _lookup(self, texts, compute):
+        cached = [self.store.get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        if missing:
+            vectors = compute(missing)
+            self.store.put_many(missing, vectors)
+            computed = dict(zip(missing, vectors.reshape(len(missing), -1)))
+            cached = [computed[text] if vector is None else vector for text, vector in zip(texts, cached)]
+        return torch.stack(cached)
+
+    def encode(self, text):
+        texts = [text] if isinstance(text, str) else list(text)
+        return self._lookup(texts, self.encoder.encode)
+
+    def encode_batch(self, texts, max_tokens_per_batch=8192, max_length=512):
+        if not texts:
+            return torch.empty(0)
+        return self._lookup(list(texts), lambda missing: self.encoder.encode_batch(
+            missing, max_tokens_per_batch=max_tokens_per_batch, max_length=max_length))
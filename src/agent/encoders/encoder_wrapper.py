@@ -1,4 +1,5 @@
 from src.agent.encoders.bert import BertEncoding
+from src.agent.encoders.embedding_store import CachedEncoder, DEFAULT_EMBEDDING_CACHE_DIR, get_embedding_store
 from src.agent.encoders.mpnet_base import MPNetEncoding
 
 
@@ -8,7 +9,12 @@ class EncoderWrapper:
         pass
 
     @staticmethod
-    def make_encoder(enc_name):
+    def make_encoder(enc_name, cache_dir=DEFAULT_EMBEDDING_CACHE_DIR):
+        """
+        :param enc_name: "bert" or "mpnet"
+        :param cache_dir: root of the on-disk embedding store shared by all agents and runs;
+                          None (the default unless EMBEDDING_CACHE_DIR is set) to always run the encoder model
+        """
 
         if enc_name == "bert":
             model = BertEncoding()
@@ -19,4 +25,6 @@ class EncoderWrapper:
         else:
             raise AssertionError(f"Encoder name {enc_name} not implemented.")
 
-        return model
+        if cache_dir is None:
+            return model
+        return CachedEncoder(model, get_embedding_store(enc_name, cache_dir))
@@ -4,6 +4,14 @@ import torch.nn.functional as F
 from transformers import AutoTokenizer
 from transformers import AutoModel
 from src.agent.encoders.abstract_encoder import AbstractEncoder
+from src.utils.model_registry import get_model_registry
+
+
+def _load(device):
+    tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-mpnet-base-v2")
+    model = AutoModel.from_pretrained("sentence-transformers/all-mpnet-base-v2").to(device)
+    model.eval()
+    return model, tokenizer
 
 
 class MPNetEncoding(AbstractEncoder):
@@ -11,25 +19,25 @@ class MPNetEncoding(AbstractEncoder):
     def __init__(self):
 
         super(AbstractEncoder, self).__init__()
-        self.tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-mpnet-base-v2")
-        self.model = AutoModel.from_pretrained("sentence-transformers/all-mpnet-base-v2")
-
-        if torch.cuda.is_available():
-            self.device = "cuda"
-            self.model.cuda()
-        else:
-            self.device = "cpu"
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # One copy per process, shared by every agent using this encoder
+        self._model_handle = get_model_registry().acquire(
+            ("encoder", "sentence-transformers/all-mpnet-base-v2", self.device, "fp32"), lambda device=self.device: _load(device), owner=self)
 
     def encode(self, text):
 
-        batch_token_ids = self.tokenizer(text,
+        with torch.inference_mode():
+            return self._embed(text)
+
+    def _embed(self, texts):
+
+        batch_token_ids = self.tokenizer(texts,
                                          padding="longest",
                                          return_tensors="pt",
                                          truncation=True,
                                          max_length=512).to(self.device)
 
-        with torch.no_grad():
-            results = self.model(**batch_token_ids)
+        results = self.model(**batch_token_ids)
 
         hidden_state = results[0]                                        # batch x max_len x hidden_dim
         attention_mask = batch_token_ids.attention_mask.unsqueeze(2)     # batch x max_len x 1
@@ -1,6 +1,7 @@
 from src.agent.abstract_agent import Agent
 from src.language_models.llm import LLMOutput
 from src.correction import Correction
+from src.agent.encoders.embedding_store import DEFAULT_EMBEDDING_CACHE_DIR
 from src.agent.encoders.encoder_wrapper import EncoderWrapper
 from src.agent.rag import RAG
 from typing import Dict
@@ -8,12 +9,20 @@ import numpy as np
 
 class IclEditAgent(Agent):
     def __init__(self, agent_config, task, workspace, encoder_type='bert', icl_count=3):
-        encoder_model = EncoderWrapper().make_encoder(encoder_type)
+        cache_dir = getattr(agent_config, 'embedding_cache_dir', DEFAULT_EMBEDDING_CACHE_DIR)
+        encoder_model = EncoderWrapper().make_encoder(encoder_type, cache_dir=cache_dir)
         encode = lambda doc: encoder_model.encode(doc).view(-1)
-        self.rag = RAG(encode)
+        encode_batch = lambda docs: encoder_model.encode_batch(docs)
+        # Without an embedding store, RAG memoizes encodings itself
+        self.rag = RAG(encode, encode_batch, ann_threshold=getattr(agent_config, 'rag_ann_threshold', None),
+                       memo_size=None if cache_dir else RAG.DEFAULT_MEMO_SIZE)
         self.icl_count = icl_count
         super().__init__(agent_config, task, workspace) 
 
+    def pre_encode(self, docs):
+        # Encode a whole dataset split up front in length-bucketed batches
+        self.rag.precompute(docs)
+
     def complete(self, text) -> LLMOutput:
         preference = None
         examples = [correction for _, __, correction in self.rag.get(text, topk=self.icl_count)]
@@ -1,25 +1,87 @@
+from collections import OrderedDict
+
+from src.agent.vector_index import VectorIndex
+from src.task.article_store import get_article_store
+
+
 class RAG:
-    def __init__(self, encode):
+    # Encodings kept in memory when the encoder has no embedding store behind it
+    DEFAULT_MEMO_SIZE = 4096
+
+    def __init__(self, encode, encode_batch=None, ann_threshold=None, memo_size=None):
+        """
+        :param memo_size: number of encodings to memoize (LRU); None when the encoder's embedding store
+                          already memoizes them
+        """
         self._encode = encode
-        self._encodings = {}
-        self.items = []
+        self._encode_batch = encode_batch
+        self._memo = OrderedDict() if memo_size else None
+        self._memo_size = memo_size
+        self._index = VectorIndex(ann_threshold=ann_threshold)
+        # (ArticleRef, whatever) per index row: docs live once in the article store and
+        # encodings only in the index
+        self._items = []
 
     def encode(self, doc):
-        if doc not in self._encodings:
-            self._encodings[doc] = self._encode(doc)
-        return self._encodings[doc]
+        if self._memo is None:
+            return self._encode(doc)
+        if doc in self._memo:
+            self._memo.move_to_end(doc)
+            return self._memo[doc]
+        encoding = self._encode(doc)
+        self._remember(doc, encoding)
+        return encoding
+
+    def _remember(self, doc, encoding):
+        self._memo[doc] = encoding
+        if len(self._memo) > self._memo_size:
+            self._memo.popitem(last=False)
+
+    def _encode_many(self, docs) -> list:
+        """Encodings of docs, encoding the ones not memoized in one batched call"""
+        if self._memo is None:
+            if self._encode_batch is not None:
+                return list(self._encode_batch(docs))
+            return [self._encode(doc) for doc in docs]
+        encodings = {doc: self._memo[doc] for doc in docs if doc in self._memo}
+        missing = list(dict.fromkeys(doc for doc in docs if doc not in encodings))
+        if missing:
+            computed = self._encode_batch(missing) if self._encode_batch is not None else [self._encode(doc) for doc in missing]
+            for doc, encoding in zip(missing, computed):
+                encodings[doc] = encoding
+                self._remember(doc, encoding)
+        return [encodings[doc] for doc in docs]
+
+    def precompute(self, docs) -> None:
+        """Encode docs (e.g. a whole dataset split) in one batched call to warm the embedding store or memo"""
+        docs = list(dict.fromkeys(docs))
+        if docs and (self._encode_batch is not None or self._memo is not None):
+            self._encode_many(docs)
 
     def add(self, doc, whatever) -> None:
-        self.items.append((self.encode(doc), doc, whatever))
-        
+        self._index.add(self.encode(doc))
+        self._items.append((get_article_store().append(doc), whatever))
+
+    def _item(self, i):
+        ref, whatever = self._items[i]
+        # A copy, so a kept encoding doesn't pin the index buffer once it grows
+        return self._index.vectors[i].clone(), ref.text, whatever
+
+    @property
+    def items(self) -> list:
+        return [self._item(i) for i in range(len(self._items))]
+
     def get(self, doc, topk=1) -> list:
-        from torch import matmul, stack
-        topk = min(topk, len(self))
-        if topk == 0:
+        return [self._item(i) for i in self._index.search(self.encode(doc), topk)]
+
+    def get_many(self, docs, topk=1) -> list:
+        """`get` for several query docs at once, scored with a single matmul"""
+        if not docs:
             return []
-        docs = stack([enc for enc, _, __ in self.items])
-        sims = matmul(docs, self.encode(doc))
-        return [self.items[i] for i in sims.topk(topk)[1]]
-    
+        from torch import stack
+        queries = stack(self._encode_many(list(docs)))
+        ids = self._index.search_many(queries, topk)
+        return [[self._item(i) for i in row] for row in ids]
+
     def __len__(self):
-        return len(self.items)
\ No newline at end of file
+        return len(self._items)
@@ -0,0 +1,81 @@
+import torch
+from typing import List, Optional
+
+
+class VectorIndex:
+    """Inner-product index over a growable, preallocated contiguous matrix.
+
+    Vectors are appended into a preallocated buffer whose capacity doubles when
+    full, so `add` is O(1) amortized and a query is a single matmul over the
+    filled rows. Once the index holds `ann_threshold` vectors (and hnswlib is
+    installed) queries are answered by an HNSW graph instead of exact search.
+    """
+
+    def __init__(self, initial_capacity: int = 64, ann_threshold: Optional[int] = None,
+                 ann_ef: int = 64, ann_m: int = 16):
+        self._capacity = initial_capacity
+        self._matrix = None
+        self._size = 0
+        self.ann_threshold = ann_threshold
+        self._ann_ef = ann_ef
+        self._ann_m = ann_m
+        self._ann = None
+
+    @property
+    def vectors(self) -> torch.Tensor:
+        return self._matrix[:self._size]
+
+    def add(self, vector: torch.Tensor) -> int:
+        """Append a 1-d vector and return its row id."""
+        vector = vector.reshape(-1)
+        if self._matrix is None:
+            self._matrix = torch.empty((self._capacity, vector.shape[0]), dtype=vector.dtype, device=vector.device)
+        elif self._size == self._matrix.shape[0]:
+            grown = torch.empty((2 * self._matrix.shape[0], self._matrix.shape[1]),
+                                dtype=self._matrix.dtype, device=self._matrix.device)
+            grown[:self._size] = self._matrix
+            self._matrix = grown
+        self._matrix[self._size] = vector
+        self._size += 1
+        if self._ann is not None:
+            self._ann_add(self._size - 1)
+        elif self.ann_threshold is not None and self._size >= self.ann_threshold:
+            self._build_ann()
+        return self._size - 1
+
+    def _build_ann(self):
+        try:
+            import hnswlib
+        except ImportError:
+            print('Warning: hnswlib is not installed, RAG keeps using exact search.')
+            self.ann_threshold = None
+            return
+        self._ann = hnswlib.Index(space='ip', dim=self._matrix.shape[1])
+        self._ann.init_index(max_elements=self._matrix.shape[0], ef_construction=200, M=self._ann_m)
+        self._ann.set_ef(self._ann_ef)
+        self._ann.add_items(self.vectors.float().cpu().numpy(), list(range(self._size)))
+
+    def _ann_add(self, i: int):
+        if self._ann.get_max_elements() <= i:
+            self._ann.resize_index(self._matrix.shape[0])
+        self._ann.add_items(self._matrix[i:i + 1].float().cpu().numpy(), [i])
+
+    def search(self, query: torch.Tensor, topk: int = 1) -> List[int]:
+        """Row ids of the `topk` vectors with the highest inner product with `query`."""
+        return self.search_many(query.reshape(1, -1), topk)[0]
+
+    def search_many(self, queries: torch.Tensor, topk: int = 1) -> List[List[int]]:
+        """`search` for each row of a (num_queries x dim) matrix, scored in one matmul."""
+        topk = min(topk, self._size)
+        if topk == 0:
+            return [[] for _ in range(queries.shape[0])]
+        if self._ann is not None:
+            # hnswlib needs ef >= k to return k neighbours
+            self._ann.set_ef(max(self._ann_ef, topk))
+            labels, _ = self._ann.knn_query(queries.float().cpu().numpy(), k=topk)
+            return [[int(i) for i in row] for row in labels]
+        sims = torch.matmul(queries.to(self._matrix.dtype), self.vectors.T)
+        return sims.topk(topk, dim=1)[1].tolist()
+
+    def __len__(self):
+        return self._size
@@ -1,7 +1,5 @@
 from src.language_models.llm import LLMOutput
 from dataclasses import dataclass
-from nltk.tokenize import word_tokenize
-import editdistance
 
 @dataclass
 class Correction:
@@ -10,7 +8,9 @@ class Correction:
     comment: LLMOutput
 
     def edit_distance(self):
-        return editdistance.eval(word_tokenize(self.original.text), word_tokenize(self.edited.text))
+        # Word-level Levenshtein distance, with tokenizations cached by the cost engine
+        from src.task.cost import get_cost_func
+        return get_cost_func('L-distance')(self)
     
     def is_edited(self):
         return self.original.text != self.edited.text
\ No newline at end of file
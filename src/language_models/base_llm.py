@@ -1,29 +1,52 @@
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
 import logging
-from typing import Union, Dict, List
+from typing import Union, Dict, List, Optional, Tuple
+from src.utils.response_cache import ResponseCache, get_response_cache
 
 class BaseLLM:
-    def __init__(self, name: str):
+    def __init__(self, name: str, device: str = "auto", dtype: str = "fp32", quantize: Optional[str] = None,
+                 num_threads: Optional[int] = None):
+        # torch/transformers are imported here rather than at module level to keep imports fast
+        from src.utils.model_loading import shared_causal_lm
+        from src.utils.prefix_cache import PrefixKVCache
         self.name = name
-        self.tokenizer = AutoTokenizer.from_pretrained(name, trust_remote_code=True)
-        self.model = AutoModelForCausalLM.from_pretrained(name, trust_remote_code=True)
-        if torch.cuda.is_available():
-            self.model = self.model.cuda()
+        # Every BaseLLM of the same model and configuration shares one lazily loaded copy
+        self._model_handle = shared_causal_lm(name, device=device, dtype=dtype, quantize=quantize,
+                                              num_threads=num_threads, owner=self)
         self.dummy = False
+        self.prefix_cache = PrefixKVCache()
+
+    @property
+    def model(self):
+        return self._model_handle.get()[0]
+
+    @property
+    def tokenizer(self):
+        return self._model_handle.get()[1]
 
     def get_response_given_completion_prompt(
-        self, prompt: str, temperature: float = 0.0, max_attempt=10000, max_tokens=300, expected_finish_reason="stop"
+        self, prompt: str, temperature: float = 0.0, max_attempt=10000, max_tokens=300, expected_finish_reason="stop",
+        prefix: Optional[str] = None,
     ):
         if self.dummy:
             return prompt[:100]
 
-        inputs = self.tokenizer(prompt, return_tensors="pt")
-        if torch.cuda.is_available():
-            inputs = {k: v.cuda() for k, v in inputs.items()}
+        cache = get_response_cache() if temperature == 0 else None
+        if cache is None:
+            return self._generate(prompt, temperature, max_tokens, prefix)
+        from src.utils.call_llm_helpers import _cache_model_name, _model_variant
+        key = ResponseCache.make_key("huggingface-completion", _cache_model_name(self.name, _model_variant(self._model_handle)),
+                                     prompt, temperature, max_tokens)
+        return cache.get_or_compute(key, lambda: self._generate(prompt, temperature, max_tokens, prefix))
+
+    def _generate(self, prompt: str, temperature: float, max_tokens: int, prefix: Optional[str] = None) -> str:
+        from src.utils.prefix_cache import prefix_token_length
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
         
-        outputs = self.model.generate(
-            **inputs,
+        # Reuse the prefill of a static prefix (e.g. the system message) across prompts
+        outputs = self.prefix_cache.generate(
+            self.model,
+            inputs,
+            prefix_token_length(self.tokenizer, prompt, prefix),
             max_new_tokens=max_tokens,
             temperature=temperature,
             do_sample=temperature > 0,
@@ -44,26 +67,119 @@ class BaseLLM:
         if self.dummy:
             return chat_log
 
-        # Convert chat log to prompt
+        prompt, prefix = self.chat_log_to_prompt(chat_log)
+        return self.get_response_given_completion_prompt(
+            prompt, temperature, max_attempt, max_tokens, expected_finish_reason, prefix=prefix
+        )
+
+    @staticmethod
+    def chat_log_to_prompt(chat_log: List[Dict]):
+        """
+        Convert a chat log to the completion prompt the model answers.
+        Returns (prompt, prefix), where prefix is the leading system message (a static prefix) or None.
+        """
         prompt = ""
+        prefix = None
         for msg in chat_log:
             role = msg["role"]
             content = msg["content"]
             if role == "system":
+                if not prompt:
+                    prefix = f"System: {content}\n"
                 prompt += f"System: {content}\n"
             elif role == "user":
                 prompt += f"User: {content}\n"
             elif role == "assistant":
                 prompt += f"Assistant: {content}\n"
         prompt += "Assistant:"
+        return prompt, prefix
 
-        return self.get_response_given_completion_prompt(
-            prompt, temperature, max_attempt, max_tokens, expected_finish_reason
-        )
+    def get_logprobs(self, prompt: str, completion: str) -> Optional[List[float]]:
+        """Per-token logprobs of `completion` following `prompt` (teacher forced)."""
+        return self.score_completions([(prompt, completion)])[0]
 
-    def get_logprobs(self, prompt, temperature: float = 0.0, max_attempt=10000):
-        return None
+    def score_completions(self, pairs: List[Tuple[str, str]], max_batch_tokens: int = 2048) -> List[Optional[List[float]]]:
+        """
+        Teacher-forced per-token logprobs of each completion given its prompt.
+
+        Pairs are grouped by prompt: each distinct prompt is prefilled once, and its
+        completions (e.g. the original and edited response to one message) are scored
+        together on top of its past_key_values, in right-padded batches of at most
+        `max_batch_tokens` completion tokens (which bounds the batch x length x vocab logits).
+        Completion tokens are tokenized on their own and appended to the prompt tokens,
+        so the returned lists have one entry per completion token.
+        """
+        if self.dummy:
+            return [None] * len(pairs)
+        import inspect
+        import torch
+
+        tokenizer = self.tokenizer
+        model = self.model
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        completions = []
+        for i, (prompt, completion) in enumerate(pairs):
+            groups.setdefault(tuple(tokenizer(prompt)["input_ids"]), []).append(i)
+            completions.append(tokenizer(" " + completion, add_special_tokens=False)["input_ids"])
+
+        # Only the last prompt position is needed from the prefill, where the model supports that
+        forward_args = inspect.signature(model.forward).parameters
+        last_only = ({'logits_to_keep': 1} if 'logits_to_keep' in forward_args else
+                     {'num_logits_to_keep': 1} if 'num_logits_to_keep' in forward_args else {})
+        pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        results: List[Optional[List[float]]] = [None] * len(pairs)
+        with torch.inference_mode():
+            for prompt_ids, indices in groups.items():
+                for i in indices:
+                    if not completions[i]:
+                        results[i] = []
+                indices = sorted((i for i in indices if completions[i]), key=lambda i: len(completions[i]), reverse=True)
+                if not indices:
+                    continue
+                prompt_tensor = torch.tensor([prompt_ids], dtype=torch.long, device=model.device)
+                prefill = model(input_ids=prompt_tensor, use_cache=True, **last_only)
+                # The last prompt position predicts the first completion token
+                first_logits = prefill.logits[0, -1].float()
+
+                batches, batch = [], []
+                for i in indices:
+                    # Longest first: the first completion of a batch sets its padded length
+                    if batch and (len(batch) + 1) * len(completions[batch[0]]) > max_batch_tokens:
+                        batches.append(batch)
+                        batch = []
+                    batch.append(i)
+                batches.append(batch)
+
+                for batch in batches:
+                    width = len(completions[batch[0]])
+                    input_ids = torch.full((len(batch), width), pad_token_id, dtype=torch.long)
+                    attention_mask = torch.ones((len(batch), len(prompt_ids) + width), dtype=torch.long)
+                    for r, i in enumerate(batch):
+                        input_ids[r, :len(completions[i])] = torch.tensor(completions[i], dtype=torch.long)
+                        attention_mask[r, len(prompt_ids) + len(completions[i]):] = 0
+                    input_ids = input_ids.to(model.device)
+                    logits = model(input_ids=input_ids, attention_mask=attention_mask.to(model.device),
+                                   past_key_values=_repeat_past(prefill.past_key_values, len(batch))).logits
+                    for r, i in enumerate(batch):
+                        length = len(completions[i])
+                        # Logits at completion position t predict token t + 1
+                        positions = torch.cat([first_logits[None], logits[r, :length - 1].float()])
+                        targets = input_ids[r, :length].to(positions.device)
+                        logprobs = torch.log_softmax(positions, dim=-1).gather(1, targets.unsqueeze(1)).squeeze(1)
+                        results[i] = logprobs.cpu().tolist()
+        return results
 
     def get_prompt_length(self, prompt, temperature: float = 0.0, max_attempt=10000):
         inputs = self.tokenizer(prompt, return_tensors="pt")
-        return len(inputs["input_ids"][0]) 
\ No newline at end of file
+        return len(inputs["input_ids"][0]) 
+
+
+def _repeat_past(past_key_values, n: int):
+    """Copy of a prompt's past_key_values repeated `n` times along the batch dimension."""
+    import copy
+    if hasattr(past_key_values, 'batch_repeat_interleave'):
+        # A transformers Cache, which the forward pass extends in place
+        past_key_values = copy.deepcopy(past_key_values)
+        past_key_values.batch_repeat_interleave(n)
+        return past_key_values
+    return tuple(tuple(t.repeat_interleave(n, dim=0) for t in layer) for layer in past_key_values)
@@ -75,13 +75,33 @@ class LLM:
         """
         Returns LLMOutput with given output as text and updated logprobs/token_count
         """
-        output = output.text if isinstance(output, LLMOutput) else output
-        # Get token count using the tokenizer
-        tokens = self.impl.tokenizer(output, return_tensors="pt")["input_ids"]
-        token_count = len(tokens[0])
-        # Create a list of -1 as placeholder logprobs (one per token)
-        logprobs = [-1] * token_count
-        return LLMOutput(text=output, logprobs=logprobs)
+        return self.get_logprobs_many(text, [output])[0]
+
+    def get_logprobs_many(self, text, outputs) -> list:
+        """
+        `get_logprobs` for several outputs of the same input text (e.g. the original and the
+        edited completion): the input is prefilled once and the outputs are scored on top of it
+        """
+        return self.get_logprobs_batch([(text, output) for output in outputs])
+
+    def get_logprobs_batch(self, items, max_batch_tokens: int = 2048) -> list:
+        """
+        Teacher-forced logprobs for many (input text, output) pairs, e.g. to score whole logs offline.
+        Pairs with the same input text share its prefill; `max_batch_tokens` bounds the output
+        tokens scored per forward pass. Returns one LLMOutput per pair, with one logprob per output token.
+        """
+        texts = [output.text if isinstance(output, LLMOutput) else output for _, output in items]
+        prompts = [self._scoring_prompt(text) for text, _ in items]
+        logprobs = self.impl.score_completions(list(zip(prompts, texts)), max_batch_tokens=max_batch_tokens)
+        return [LLMOutput(text=text, logprobs=lp) for text, lp in zip(texts, logprobs)]
+
+    def _scoring_prompt(self, input_prompt) -> str:
+        # The prompt the model sees in `respond`, so scores match what it would generate
+        if self.impl.name == "gpt-35-turbo-instruct":
+            return input_prompt
+        if type(input_prompt) == str:
+            input_prompt = self.chat_prompt_wrapper(input_prompt).to_list()
+        return self.impl.chat_log_to_prompt(input_prompt)[0]
 
     @staticmethod
     def check_last_text_token(text: str, text_token_count: int, token: str, logprobs) -> bool:
@@ -0,0 +1,100 @@
+import hashlib
+import mmap
+import tempfile
+import threading
+from typing import Dict, Optional, Union
+
+
+class ArticleRef:
+    """Compact reference to an article in the process-wide ArticleStore: its byte offset and length."""
+    __slots__ = ('offset', 'length')
+
+    def __init__(self, offset: int, length: int):
+        self.offset = offset
+        self.length = length
+
+    @property
+    def text(self) -> str:
+        return get_article_store().get(self)
+
+    def __eq__(self, other):
+        return isinstance(other, ArticleRef) and (self.offset, self.length) == (other.offset, other.length)
+
+    def __hash__(self):
+        return hash((self.offset, self.length))
+
+    def __repr__(self):
+        return f'ArticleRef(offset={self.offset}, length={self.length})'
+
+
+class ArticleStore:
+    """
+    Append-only store of article texts in one memory-mapped file.
+
+    Each article is written once as UTF-8 and addressed by an ArticleRef (offset, length);
+    identical texts are stored once. Text is decoded from the map only when it is read,
+    e.g. when a prompt is rendered, so datasets and RAG entries hold (offset, length) refs instead of
+    their own copies. The backing file is an anonymous temporary file unless `path` is given.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._file = open(path, 'a+b') if path else tempfile.TemporaryFile()
+        self._file.seek(0, 2)
+        self._size = self._file.tell()
+        self._mmap = None
+        self._digests: Dict[bytes, ArticleRef] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def append(self, text: str) -> ArticleRef:
+        """Store `text` (unless an identical text is stored already) and return its ref."""
+        data = text.encode('utf-8')
+        digest = self._digest(data)
+        with self._lock:
+            ref = self._digests.get(digest)
+            if ref is None:
+                self._file.seek(0, 2)
+                self._file.write(data)
+                ref = self._digests[digest] = ArticleRef(self._size, len(data))
+                self._size += len(data)
+        return ref
+
+    def get(self, ref: ArticleRef) -> str:
+        end = ref.offset + ref.length
+        if ref.length == 0:
+            return ''
+        with self._lock:
+            if self._mmap is None or len(self._mmap) < end:
+                # The file grew since it was mapped: flush appends and map the whole file again
+                self._file.flush()
+                self._mmap = mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+            return self._mmap[ref.offset:end].decode('utf-8')
+
+    def __len__(self):
+        return len(self._digests)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+
+_store: Optional[ArticleStore] = None
+_store_lock = threading.Lock()
+
+
+def get_article_store() -> ArticleStore:
+    """The process-wide ArticleStore, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArticleStore()
+    return _store
+
+
+def resolve_article(article: Union[str, ArticleRef]) -> str:
+    """Text of an article given either as text or as an ArticleRef."""
+    return article.text if isinstance(article, ArticleRef) else article
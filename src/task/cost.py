@@ -1,5 +1,110 @@
+import os
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import editdistance
+
+# Approximates NLTK's word_tokenize (words and single punctuation marks) at a fraction of its cost
+_WORD_RE = re.compile(r"\w+(?:'\w+)?|[^\w\s]")
+
+# Batches smaller than this are scored in-process; a pool is not worth starting for them
+MIN_PARALLEL_BATCH = 256
+
+
+def _make_tokenizer(backend: str) -> Callable[[str], Sequence]:
+    """
+    :param backend: 'nltk' (word_tokenize), 'regex', 'char' or 'model:<Hugging Face tokenizer name>'
+    :return: a function from text to a sequence of tokens
+    """
+    if backend == 'nltk':
+        from nltk.tokenize import word_tokenize
+        return word_tokenize
+    if backend == 'regex':
+        return _WORD_RE.findall
+    if backend == 'char':
+        return lambda text: text
+    if backend.startswith('model:'):
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(backend[len('model:'):])
+        return lambda text: tokenizer(text, add_special_tokens=False)['input_ids']
+    raise ValueError(f'Unknown tokenizer backend {backend}')
+
+
+class CostEngine:
+    """
+    Levenshtein distance between the original and edited text of a correction, over the tokens
+    of `backend`. Tokenizations are cached per text, so a text scored repeatedly (e.g. an
+    unedited completion, or rescoring logs) is tokenized once. Callable on a single correction;
+    `batch` scores many at once, across a process pool for large batches.
+    """
+
+    def __init__(self, backend: str = 'nltk', cache_size: int = 65536):
+        self.backend = backend
+        self.cache_size = cache_size
+        self._tokenize = None
+
+    def tokenize(self, text: str) -> Tuple:
+        if self._tokenize is None:
+            # Tokenizer backends are loaded on first use
+            tokenize = _make_tokenizer(self.backend)
+            self._tokenize = lru_cache(maxsize=self.cache_size)(lambda text: tuple(tokenize(text)))
+        return self._tokenize(text)
+
+    def distance(self, original: str, edited: str) -> int:
+        if original == edited:
+            return 0
+        return editdistance.eval(self.tokenize(original), self.tokenize(edited))
+
+    def __call__(self, correction) -> int:
+        return self.distance(correction.original.text, correction.edited.text)
+
+    def batch(self, corrections, num_workers: Optional[int] = None, chunksize: int = 64) -> List[int]:
+        """
+        Costs of many corrections, in order.
+        :param num_workers: size of the process pool (os.cpu_count() if None); 0 or 1 scores in-process
+        """
+        pairs = [(correction.original.text, correction.edited.text) for correction in corrections]
+        return self.batch_texts(pairs, num_workers, chunksize)
+
+    def batch_texts(self, pairs: Sequence[Tuple[str, str]], num_workers: Optional[int] = None,
+                    chunksize: int = 64) -> List[int]:
+        """`batch` for (original text, edited text) pairs"""
+        num_workers = os.cpu_count() if num_workers is None else num_workers
+        if num_workers <= 1 or len(pairs) < MIN_PARALLEL_BATCH:
+            return [self.distance(original, edited) for original, edited in pairs]
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(self.backend, self.cache_size)) as pool:
+            return list(pool.map(_worker_distance, pairs, chunksize=chunksize))
+
+
+_worker_engine: Optional[CostEngine] = None
+
+
+def _init_worker(backend: str, cache_size: int):
+    global _worker_engine
+    _worker_engine = CostEngine(backend, cache_size)
+
+
+def _worker_distance(pair: Tuple[str, str]) -> int:
+    return _worker_engine.distance(*pair)
+
+
+# Cost function name -> tokenizer backend
+COST_FUNCS = {
+    'L-distance': 'nltk',           # word-level over NLTK tokens (the original cost)
+    'L-distance-regex': 'regex',    # word-level over a regex tokenizer, much faster than NLTK
+    'L-distance-char': 'char',      # character-level
+}
+# 'L-distance-tokens:<tokenizer name>' is Levenshtein over the token ids of a Hugging Face tokenizer
+
+
+@lru_cache(maxsize=None)
 def get_cost_func(cost_func_name):
-    if cost_func_name == 'L-distance':
-        return lambda correction: correction.edit_distance()
+    if cost_func_name in COST_FUNCS:
+        return CostEngine(COST_FUNCS[cost_func_name])
+    elif cost_func_name.startswith('L-distance-tokens:'):
+        return CostEngine('model:' + cost_func_name[len('L-distance-tokens:'):])
     else:
-        raise ValueError(f'Unknown cost function {cost_func_name}')
\ No newline at end of file
+        raise ValueError(f'Unknown cost function {cost_func_name}')
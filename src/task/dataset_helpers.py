@@ -1,13 +1,146 @@
-from datasets import load_dataset
-from torch.utils.data import Dataset
-from typing import List, Dict, Any, Set, Optional
+from typing import List, Dict, Any, Set, Optional, Union
 from global_user_intents import USER_INTENTS, AtomicIntent
+from src.task.article_store import ArticleRef, get_article_store, resolve_article
+import os
 import random
+import shutil
+from pathlib import Path
+
+# Preprocessed (filtered/reshaped) splits are saved here as Arrow, keyed by dataset, split and filter version
+DATASET_CACHE_DIR = os.environ.get('DATASET_CACHE_DIR', '.cache/datasets')
+DATASET_NUM_PROC = int(os.environ.get('DATASET_NUM_PROC', min(8, os.cpu_count() or 1)))
+
+
+# Batched preprocessing functions; module-level so that datasets can ship them to worker processes
+
+def _wikipedia_length_filter(batch):
+    lengths = [len(text.split()) for text in batch['text']]
+    return [500 < length < 700 for length in lengths]  # 4809
+
+
+def _ccby_has_highlights(batch):
+    return [highlights != [] for highlights in batch['author_highlights']]
+
+
+def _ccby_to_text(batch, indices):
+    return {'id': indices,
+            'text': [' My title: ' + title + '. My abstract: ' + abstract + ' My highlights: ' + '. '.join(highlights)
+                     for title, abstract, highlights in zip(batch['title'], batch['abstract'], batch['author_highlights'])]}
+
+
+def _ampere_to_text(batch):
+    return {'id': batch['doc_id'], 'text': [' '.join(text) for text in batch['text']]}
+
+
+def _paper_tweet_to_tweets(batch):
+    tweets = []
+    for ex in batch['text']:
+        if '[' in ex:
+            continue
+        try:
+            tweet = ex[(ex.index('"') + 1):(ex.rfind('"') - 2)]
+        except Exception:
+            continue
+        tweets.append(tweet)
+    return {'text': tweets}
+
+
+def _add_index_id(batch, indices):
+    return {'id': indices}
+
+
+# name -> how to load it: hub path and config, a fixed split if the dataset has only one,
+# the id/article columns, and the preprocessing steps with their version. Bump `version`
+# whenever a step changes so cached artifacts of the old version are not reused.
+# Steps are (kind, function, kwargs) with kind 'filter' or 'map'.
+DATASET_SOURCES = {
+    # possible splits: train, validation, test
+    'cnn_dailymail': dict(path='cnn_dailymail', config='3.0.0', id_key='id', article_key='article'),
+    # possible splits: train, validation, test
+    'xsum': dict(path='xsum', id_key='id', article_key='document'),
+    # possible splits: train, development, validation, test
+    'slf5k': dict(path='JeremyAlain/SLF5K', id_key='id', article_key='post'),
+    # possible splits: train
+    'wikipedia': dict(path='wikipedia', config='20220301.simple', id_key='id', article_key='text', version=1,
+                      steps=[('filter', _wikipedia_length_filter, {})]),
+    # possible splits: train
+    'CShorten/ML-ArXiv-Papers': dict(path='CShorten/ML-ArXiv-Papers', id_key='Unnamed: 0.1', article_key='abstract'),
+    # possible splits: train, test, unsupervised
+    'imdb': dict(path='imdb', id_key='label', article_key='text'),
+    'ccby': dict(path='orieg/elsevier-oa-cc-by', fixed_split='train', id_key='id', article_key='text', version=1,
+                 steps=[('filter', _ccby_has_highlights, {}),
+                        ('map', _ccby_to_text, {'with_indices': True, 'remove_columns': True})]),
+    'ampere': dict(path='launch/ampere', fixed_split='train', id_key='id', article_key='text', version=1,
+                   steps=[('map', _ampere_to_text, {'remove_columns': True})]),
+    'paper_tweet': dict(path='nitsanb/paper_tweet', fixed_split='train', id_key='id', article_key='text', version=1,
+                        steps=[('map', _paper_tweet_to_tweets, {'remove_columns': True}),
+                               ('map', _add_index_id, {'with_indices': True})]),
+}
+
+
+def _source(dataset: str) -> Dict[str, Any]:
+    if dataset not in DATASET_SOURCES:
+        raise NotImplementedError
+    return DATASET_SOURCES[dataset]
+
+
+def _cache_path(dataset: str, split: str) -> Path:
+    source = _source(dataset)
+    name = dataset.replace('/', '__')
+    return Path(DATASET_CACHE_DIR) / f"{name}_{source.get('fixed_split') or split}_v{source['version']}"
+
+
+def _load_split(dataset: str, split: str = 'train'):
+    """
+    Load a split as a (memory-mapped) Hugging Face Dataset, preprocessed if the dataset needs it.
+    Preprocessing runs as batched, multi-process filter/map steps once; the result is saved
+    as Arrow under DATASET_CACHE_DIR and reloaded from there afterwards.
+    """
+    from datasets import load_dataset, load_from_disk
+    source = _source(dataset)
+    split = source.get('fixed_split') or split
+    steps = source.get('steps')
+    if steps:
+        path = _cache_path(dataset, split)
+        if path.exists():
+            return load_from_disk(str(path))
+    data = load_dataset(source['path'], source.get('config'), split=split)
+    if not steps:
+        return data
+    for kind, function, kwargs in steps:
+        kwargs = dict(kwargs)
+        if kwargs.pop('remove_columns', False):
+            kwargs['remove_columns'] = data.column_names
+        data = getattr(data, kind)(function, batched=True, num_proc=DATASET_NUM_PROC, **kwargs)
+    # Saved next to its final place and renamed into it, so an interrupted save is never loaded
+    tmp_path = path.with_name(f'{path.name}.tmp-{os.getpid()}')
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    data.save_to_disk(str(tmp_path))
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another process saved the same split first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return data
+
+
+def _num_rows_from_metadata(dataset: str, split: str) -> Optional[int]:
+    """Row count of a raw split from the dataset's split metadata, without loading it."""
+    from datasets import load_dataset_builder
+    source = _source(dataset)
+    try:
+        splits = load_dataset_builder(source['path'], source.get('config')).info.splits
+        return splits[source.get('fixed_split') or split].num_examples
+    except Exception:
+        return None
 
 
 def get_dataset_stats(dataset: str, split: str = 'train') -> Optional[Dict[str, int]]:
     """
-    Get statistics about a dataset without loading the full dataset.
+    Get statistics about a dataset without iterating over it.
+    The total comes from the split metadata; for filtered datasets the filtered count
+    is the length of the cached preprocessed split (built once if missing).
     
     Args:
         dataset: name of the dataset to get stats for
@@ -16,52 +149,24 @@ def get_dataset_stats(dataset: str, split: str = 'train') -> Optional[Dict[str,
     Returns:
         Dictionary containing dataset statistics or None if dataset not supported
     """
+    if dataset not in DATASET_SOURCES:
+        return None
     try:
-        if dataset == 'cnn_dailymail':
-            data = load_dataset(dataset, '3.0.0', split=split)
-        elif dataset == 'xsum':
-            data = load_dataset(dataset)[split]
-        elif dataset == 'slf5k':
-            data = load_dataset("JeremyAlain/SLF5K")[split]
-        elif dataset == 'wikipedia':
-            data = load_dataset(dataset, '20220301.simple')[split]
-            # For wikipedia, we need to count filtered examples
-            total = len(data)
-            filtered = sum(1 for ex in data if 500 < len(ex['text'].split()) < 700)
-            return {
-                "total_examples": total,
-                "filtered_examples": filtered
-            }
-        elif dataset == 'CShorten/ML-ArXiv-Papers':
-            data = load_dataset(dataset)[split]
-        elif dataset == 'imdb':
-            data = load_dataset(dataset)[split]
-        elif dataset == 'ccby':
-            data = load_dataset('orieg/elsevier-oa-cc-by')['train']
-            # For ccby, we need to count examples with highlights
-            total = len(data)
-            filtered = sum(1 for ex in data if ex['author_highlights'] != [])
+        total = _num_rows_from_metadata(dataset, split)
+        if not DATASET_SOURCES[dataset].get('steps'):
+            if total is None:
+                total = len(_load_split(dataset, split))
             return {
-                "total_examples": total,
-                "filtered_examples": filtered
+                "total_examples": total
             }
-        elif dataset == 'ampere':
-            data = load_dataset('launch/ampere', split='train')
-        elif dataset == 'paper_tweet':
-            data = load_dataset('nitsanb/paper_tweet', split='train')
-            # For paper_tweet, we need to count valid tweets
-            total = len(data)
-            filtered = sum(1 for ex in data if '[' not in ex['text'] and '"' in ex['text'])
-            return {
-                "total_examples": total,
-                "filtered_examples": filtered
-            }
-        else:
-            return None
-            
-        # For datasets without filtering
+        filtered = len(_load_split(dataset, split))
+        if total is None:
+            from datasets import load_dataset
+            source = _source(dataset)
+            total = len(load_dataset(source['path'], source.get('config'), split=source.get('fixed_split') or split))
         return {
-            "total_examples": len(data)
+            "total_examples": total,
+            "filtered_examples": filtered
         }
     except Exception as e:
         print(f"Error getting stats for {dataset}: {e}")
@@ -88,96 +193,36 @@ def print_dataset_stats(dataset: str, split: str = 'train'):
     print("========================\n")
 
 
-def load_data(dataset: str, num_ex: int = -1, split: str = 'train', num_users: int = 5):
+def load_data(dataset: str, num_ex: int = -1, split: str = 'train', num_users: int = 5, rng=None):
     """
     return an OurInputDataset object with the specified number of examples
-    see the choices for split on each dataset below
+    see the choices for split on each dataset in DATASET_SOURCES
     
     Args:
         dataset: name of the dataset to load
         num_ex: number of examples to load (-1 for all)
         split: dataset split to use
         num_users: number of users to distribute examples among
+        rng: optional numpy Generator; if given, `num_ex` random examples are drawn with
+             `rng.permutation` (the same draws as shuffling the full split with `rng.shuffle`)
+             and only those rows are decoded, instead of the first `num_ex`
     """
-
-    if dataset == 'cnn_dailymail':
-        # possible splits: train, validation, test
-        data = load_dataset(dataset, '3.0.0', split=split)
-        parsed_data = OurInputDataset(data=data, num_ex=num_ex, id_key='id', article_key='article',
-                                      doc_type=dataset, num_users=num_users)
-    elif dataset == 'xsum':
-        # possible splits: train, validation, test
-        data = load_dataset(dataset)[split]
-        parsed_data = OurInputDataset(data=data, num_ex=num_ex, id_key='id', article_key='document',
-                                      doc_type=dataset, num_users=num_users)
-    elif dataset == 'slf5k':
-        # possible splits: train, development, validation, test
-        data = load_dataset("JeremyAlain/SLF5K")[split]
-        parsed_data = OurInputDataset(data=data, num_ex=num_ex, id_key='id', article_key='post',
-                                      doc_type=dataset, num_users=num_users) 
-    elif dataset == 'wikipedia':
-        # possible splits: train 
-        data = load_dataset(dataset, '20220301.simple')[split]
-        filtered_data = []
-        for ex in data:
-            length = len(ex['text'].split()) 
-            if length > 500 and length < 700: # 4809
-                filtered_data.append(ex)
-        parsed_data = OurInputDataset(data=filtered_data, num_ex=num_ex, id_key='id', article_key='text',
-                                      doc_type=dataset, num_users=num_users)
-    elif dataset == 'CShorten/ML-ArXiv-Papers':
-        # possible splits: train
-        data = load_dataset(dataset)[split]
-        parsed_data = OurInputDataset(data=data, num_ex=num_ex, id_key='Unnamed: 0.1', article_key='abstract',
-                                      doc_type=dataset, num_users=num_users)
-    elif dataset == 'imdb':
-        # possible splits: train, test, unsupervised
-        data = load_dataset(dataset)[split]
-        parsed_data = OurInputDataset(data=data, num_ex=num_ex, id_key='label', article_key='text',
-                                      doc_type=dataset, num_users=num_users)
-    elif dataset == 'ccby':
-        data = load_dataset('orieg/elsevier-oa-cc-by')['train']
-        filtered_data = []
-        for ex in data:
-            if ex['author_highlights'] != []:
-                filtered_data.append({'id': len(filtered_data), 
-                                      'text': ' My title: ' + ex['title'] + 
-                                              '. My abstract: ' + ex['abstract'] +
-                                              ' My highlights: ' + '. '.join(ex['author_highlights'])})
-        parsed_data = OurInputDataset(data=filtered_data, num_ex=num_ex, id_key='id', article_key='text',
-                                      doc_type=dataset, num_users=num_users) 
-    elif dataset == 'ampere':
-        data = load_dataset('launch/ampere', split='train')
-        data = [{'id': ex['doc_id'], 'text': ' '.join(ex['text'])} for ex in data]
-        parsed_data = OurInputDataset(data=data, num_ex=num_ex, id_key='id', article_key='text',
-                                      doc_type=dataset, num_users=num_users) 
-    elif dataset == 'paper_tweet':
-        data = load_dataset('nitsanb/paper_tweet', split='train')
-        filtered_data = []
-        for ex in data:
-            ex = ex['text']
-            if '[' in ex:
-                continue
-            try:
-                tweet = ex[(ex.index('"') + 1):(ex.rfind('"') - 2)]
-            except Exception:
-                continue 
-            filtered_data.append({'id': len(filtered_data), 'text': tweet})
-        parsed_data = OurInputDataset(data=filtered_data, num_ex=num_ex, id_key='id', article_key='text',
-                                      doc_type=dataset, num_users=num_users) 
-    else:
-        raise NotImplementedError
-
-    return parsed_data
+    source = _source(dataset)
+    data = _load_split(dataset, split)
+    return OurInputDataset(data=data, num_ex=num_ex, id_key=source['id_key'], article_key=source['article_key'],
+                           doc_type=dataset, num_users=num_users, rng=rng)
 
 
 class OurInputExample:
     """
     Structure for one input example with id, article, and metadata
     """
+    __slots__ = ('id', '_article', 'doc_type', 'user_pref', 'model_summary', 'user_edits', 'model_refinement',
+                 'eval_yesno', 'eval_rationale')
+
     def __init__(self, 
                  id: str, 
-                 article: str, 
+                 article: Union[str, ArticleRef], 
                  doc_type: str,
                  user_pref: Set[AtomicIntent] = None,
                  model_summary: str = None, 
@@ -187,9 +232,10 @@ class OurInputExample:
                  eval_rationale: str = None):
         """
         Creates one InputExample with the given id, article and metadata
+        `article` may be an ArticleRef into the article store; it is then decoded on access
         """
         self.id = id
-        self.article = article
+        self._article = article
         self.doc_type = doc_type
         self.user_pref = user_pref
         self.model_summary = model_summary
@@ -198,58 +244,101 @@ class OurInputExample:
         self.eval_yesno = eval_yesno
         self.eval_rationale = eval_rationale
 
+    @property
+    def article(self) -> str:
+        return resolve_article(self._article)
+
+    @article.setter
+    def article(self, article: Union[str, ArticleRef]):
+        self._article = article
+
+    @property
+    def article_ref(self) -> Optional[ArticleRef]:
+        return self._article if isinstance(self._article, ArticleRef) else None
+
     def __str__(self):
         article_preview = self.article[:100] + "..." if len(self.article) > 100 else self.article
         return f"<InputExample> article ID {self.id}: {article_preview}"
 
 
-class OurInputDataset(Dataset): 
+class OurInputDataset:
     """
     Structure for a dataset with example ids and articles
     We create this object to unify different datasets on hugging face which have different formats
+    It is a map-style dataset (`__getitem__` and `__len__`), so it works with torch's DataLoader
+    without importing torch here
+
+    Examples are stored column-wise (ids, article offsets/lengths, user codes) together with a
+    user -> rows index, and OurInputExample objects are only created when an example is accessed.
+    Article texts are written once to the process-wide ArticleStore and decoded on access
     """
-    def __init__(self, data, num_ex: int, id_key: str, article_key: str, doc_type: str = '', num_users: int = 5):
+    def __init__(self, data, num_ex: int, id_key: str, article_key: str, doc_type: str = '', num_users: int = 5,
+                 rng=None):
+        from array import array
         from itertools import islice
-        if num_ex > 0:
-            data = islice(data, num_ex)
+        if rng is not None:
+            # Random sample: only the selected rows are decoded; they keep their original index
+            indices = rng.permutation(len(data))
+            if num_ex > 0:
+                indices = indices[:num_ex]
+            indices = [int(i) for i in indices]
+            rows = data.select(indices) if hasattr(data, 'select') else [data[i] for i in indices]
+            data = zip(indices, rows)
+        else:
+            data = enumerate(islice(data, num_ex) if num_ex > 0 else data)
 
         # Get list of user IDs
         user_ids = list(USER_INTENTS.keys())
         if num_users > len(user_ids):
             num_users = len(user_ids)
-        
+        self._user_ids = user_ids[:num_users]
+
         # Create dataset with one user per example
-        self.dataset = []
-        for i, d in enumerate(data):
+        self.doc_type = doc_type
+        self._ids = []
+        self._article_offsets = array('Q')
+        self._article_lengths = array('Q')
+        store = get_article_store()
+        self._user_codes = array('H')
+        self._rows_by_user: Dict[str, array] = {}
+        for i, d in data:
             # Assign each example to one user in a round-robin fashion
-            user_id = user_ids[i % num_users]
-            user_pref = USER_INTENTS[user_id].intents
-            self.dataset.append(OurInputExample(
-                id=f"{d[id_key]}_{user_id}",
-                article=d[article_key],
-                doc_type=doc_type,
-                user_pref=user_pref
-            ))
-
-    def __getitem__(self, item):        
-        return self.dataset[item]
-    
+            code = i % num_users
+            user_id = self._user_ids[code]
+            self._rows_by_user.setdefault(user_id, array('I')).append(len(self._ids))
+            self._ids.append(f"{d[id_key]}_{user_id}")
+            ref = store.append(d[article_key])
+            self._article_offsets.append(ref.offset)
+            self._article_lengths.append(ref.length)
+            self._user_codes.append(code)
+
+    def _example(self, row: int) -> OurInputExample:
+        user_id = self._user_ids[self._user_codes[row]]
+        return OurInputExample(
+            id=self._ids[row],
+            article=ArticleRef(self._article_offsets[row], self._article_lengths[row]),
+            doc_type=self.doc_type,
+            user_pref=USER_INTENTS[user_id].intents
+        )
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._example(row) for row in range(len(self))[item]]
+        return self._example(range(len(self))[item])
+
     def __len__(self):
-        return len(self.dataset)
-        
+        return len(self._ids)
+
+    def __iter__(self):
+        return (self._example(row) for row in range(len(self)))
+
     def get_unique_users(self) -> List[str]:
         """
-        Returns a list of unique user IDs in the dataset.
-        Each user ID is extracted from the example IDs which are in the format 'original_id_userid'
+        Returns a sorted list of unique user IDs in the dataset.
         """
-        unique_users = set()
-        for example in self.dataset:
-            # Extract user ID from the combined ID (format: original_id_userid)
-            user_id = example.id.split('_')[-1]
-            unique_users.add(user_id)
-        return sorted(list(unique_users))
+        return sorted(self._rows_by_user)
         
-    def get_examples_by_user(self, user_id: str) -> List[OurInputExample]:
+    def get_examples_by_user(self, user_id: str) -> 'ExampleView':
         """
         Returns all examples assigned to a specific user.
         
@@ -257,7 +346,29 @@ class OurInputDataset(Dataset):
             user_id: The ID of the user to get examples for
             
         Returns:
-            A list of OurInputExample objects assigned to the specified user
+            A read-only sequence of the OurInputExample objects assigned to the specified user,
+            in dataset order; examples are created on access
         """
-        return [example for example in self.dataset if example.id.split('_')[-1] == user_id]
-        
+        return ExampleView(self, self._rows_by_user.get(user_id, ()))
+
+
+class ExampleView:
+    """
+    Lightweight sequence over some rows of an OurInputDataset
+    """
+    __slots__ = ('_dataset', '_rows')
+
+    def __init__(self, dataset: OurInputDataset, rows):
+        self._dataset = dataset
+        self._rows = rows
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._dataset._example(row) for row in self._rows[item]]
+        return self._dataset._example(self._rows[item])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return (self._dataset._example(row) for row in self._rows)
@@ -1,5 +1,4 @@
 from typing import List, Dict, Any, Set, Callable
-import openai
 import os
 from dataclasses import dataclass
 from enum import Enum
@@ -10,7 +9,6 @@ from global_user_intents import USER_INTENTS, GLOBAL_GUIDELINES, AtomicIntent
 from src.task.summarization import Summarization
 from src.task.email_writing import EmailWriting
 
-import numpy as np
 
 @dataclass
 class TaskConfig:
@@ -19,18 +17,21 @@ class TaskConfig:
     num_train_ex: int = -1
     seed: int = 42
     cost: str = "L-distance"
+    prompt_layout: str = "article_first"
 
 class IntentHandler:
-    def __init__(self, model_caller: Callable[[str, str], str]):
+    def __init__(self, model_caller: Callable[[str, str], str], prompt_layout: str = "article_first"):
         """
         Initialize intent handler with a model caller function
         Args:
             model_caller: A function that takes (prompt, input_text) and returns the model's response
+            prompt_layout: 'article_first' or 'static_first' (static guidelines/preferences before the input)
         """
         self.model_caller = model_caller
+        self.prompt_layout = prompt_layout
         self._intents: Dict[str, Set[AtomicIntent]] = {}
         self._initialize_intents()
-        self._tasks = {}  # Initialize empty, will create tasks as needed
+        self._tasks = {}  # (task, dataset) -> task, created as needed
         
     def _initialize_intents(self):
         """Initialize intents for each user."""
@@ -38,17 +39,21 @@ class IntentHandler:
             self._intents[user_id] = user_intent.intents
     
     def _get_task(self, task_name: str, dataset_name: str) -> Task:
-        """Get or create a task instance with only the needed dataset."""
-        if task_name not in self._tasks:
+        """Get or create a task instance with only the needed dataset.
+
+        Tasks load their data lazily, so a task used only to build prompts never loads its dataset.
+        """
+        key = (task_name, dataset_name)
+        if key not in self._tasks:
             # Create task config with only the dataset that is actually used
-            task_config = TaskConfig(datasets=[dataset_name])
+            task_config = TaskConfig(datasets=[dataset_name], prompt_layout=self.prompt_layout)
             if task_name == "summarization":
-                self._tasks[task_name] = Summarization(task_config)
+                self._tasks[key] = Summarization(task_config)
             elif task_name == "email_writing":
-                self._tasks[task_name] = EmailWriting(task_config)
+                self._tasks[key] = EmailWriting(task_config)
             else:
                 raise ValueError(f"Unknown task: {task_name}. Supported tasks are: ['summarization', 'email_writing']")
-        return self._tasks[task_name]
+        return self._tasks[key]
     
     # def _construct_prompt(self, task: str, input_text: str, user_id: str, dataset_name: str) -> str:
     #     """Construct a prompt that combines user intents with global guidelines."""
@@ -0,0 +1,251 @@
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
+
+from global_user_intents import AtomicIntent, GLOBAL_GUIDELINES
+
+# Template texts per task and prompt kind. A kind is either a single template or a
+# (head, item, tail) triple for prompts built from a list (ICL examples, preferences):
+# the item template is rendered once per list element. `{guideline}` is bound when a
+# template is compiled for a dataset; every other field is filled in at render time.
+TEMPLATES = {
+    'summarization': {
+        'resolution': (
+            "Article:\n{input}\n"
+            "Summary:\n{output}\n"
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Is the above summary of the above article good for a person who would love to use the following style: {preference}? Please answer yes or no."),
+        'revision': (
+            "Summary:\n{output}\n"
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Please revise the above summary of an article to meet both the dataset guidelines and user preferences."),
+        'task_no_preference': (
+            "Article:\n{input}\n"
+            "Please summarize the above article."),
+        'task': (
+            "Article:\n{input}\n"
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Please write a summary of the above article that follows both the dataset guidelines and user preferences."),
+        'icl': (
+            "",
+            "Original summary of an article:\n{original}\nRevised summary by a user:\n{edited}\n\n",
+            "Article:\n{input}\n"
+            "Dataset guidelines: {guideline}\n"
+            "Based on the edits and revision by this user on the original summary in the above examples, please summarize the above article following the dataset guidelines."),
+        'icl_preference': (
+            "List of user preferences successfully being used to generate summaries of similar documents:\n",
+            "- {preference}\n",
+            "Article:\n{input}\n"
+            "Dataset guidelines: {guideline}\n"
+            "Using the qualities most represented in the above list of preferences and following the dataset guidelines, please summarize the above article."),
+        'preference_inference': (
+            "",
+            "Original summary of an article: {original}\nRevised summary by a user: {edited}\n\n",
+            "Dataset guidelines: {guideline}\n"
+            "Based on the edits and revision by this user on the original summary in the above examples, what do you find about this user's generic preference in terms of writing style and formatting?\n"
+            "Please answer in a short phrase and only recommend those preferences that are widely used."),
+        'majority_preference': (
+            "List of user preferences successfully being used to generate summaries of similar documents: \n",
+            "- {preference}\n",
+            "Dataset guidelines: {guideline}\n"
+            "Based on the above examples and dataset guidelines, please come up with short phrase with the most represented summarization preferences of the user."),
+        'base': (
+            "Article:\n{input}\n"
+            "Dataset guidelines: {guideline}\n"
+            "Please write a summary of the above article following the dataset guidelines."),
+        'edit': (
+            "Article:\n{input}\n"
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Base summary:\n{output}\n"
+            "Please revise the above base summary to better match both the dataset guidelines and user preferences. Focus on making the summary more aligned with the user's preferred style while maintaining the key information."),
+        'base_prefix': "",
+        'edit_prefix': "",
+    },
+    'email_writing': {
+        'resolution': (
+            "Notes:\n{input}\n"
+            "Email:\n{output}\n"
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Is the above email based on the above notes good for a user who wants the following style: {preference}? Please answer yes or no."),
+        'revision': (
+            "Email:\n{output}\n"
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Please revise the above email to meet both the dataset guidelines and user preferences."),
+        'task_no_preference': (
+            "Notes:\n{input}\n"
+            "Please write a short email based on your above notes."),
+        'task': (
+            "Notes:\n{input}\n"
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Please write a short email based on the above notes that follows both the dataset guidelines and user preferences."),
+        'icl': (
+            "",
+            "Original email:\n{original}\nRevised email:\n{edited}\n\n",
+            "Notes:\n{input}\n"
+            "Dataset guidelines: {guideline}\n"
+            "Based on the edits and revision by this user on the original email in the above examples, please write an email based on the above notes following the dataset guidelines."),
+        'icl_preference': (
+            "List of user preferences successfully being used to generate emails of a similar kind:\n",
+            "- {preference}\n",
+            "Notes:\n{input}\n"
+            "Dataset guidelines: {guideline}\n"
+            "Using the qualities most represented in the above list of preferences and following the dataset guidelines, please write an email based on the above notes."),
+        'preference_inference': (
+            "",
+            "Original email:\n{original}\nRevised email:\n{edited}\n\n",
+            "Dataset guidelines: {guideline}\n"
+            "Based on the edits and revision by this user on the original email in the above examples, what do you find about this user's generic preference in terms of writing style and formatting?\n"
+            "Please answer in a short phrase and only recommend those preferences that are widely used."),
+        'majority_preference': (
+            "List of user preferences successfully being used to generate emails of a similar kind:\n",
+            "- {preference}\n",
+            "Dataset guidelines: {guideline}\n"
+            "Based on the above examples and dataset guidelines, please come up with short phrase with the most represented writing preferences of this user."),
+        'base': (
+            "Notes:\n{input}\n"
+            "Dataset guidelines: {guideline}\n"
+            "Please write a short email based on the above notes following the dataset guidelines."),
+        'edit': (
+            "Notes:\n{input}\n"
+            "Base email:\n{output}\n"
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Please revise the above base email to better match both the dataset guidelines and user preferences. Focus on making the email more aligned with the user's preferred style while maintaining the key information."),
+        'base_prefix': "",
+        'edit_prefix': "",
+    },
+}
+
+# 'static_first' layout: everything shared across inputs comes first, so prompts of
+# one dataset (and user) share a prefix that prefix/response caches can reuse
+_STATIC_FIRST_PREFIXES = {
+    'summarization': {
+        'base_prefix': (
+            "Dataset guidelines: {guideline}\n"
+            "Please write a summary of the article below following the dataset guidelines.\n"),
+        'edit_prefix': (
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Please revise the base summary below to better match both the dataset guidelines and user preferences. Focus on making the summary more aligned with the user's preferred style while maintaining the key information.\n"),
+    },
+    'email_writing': {
+        'base_prefix': (
+            "Dataset guidelines: {guideline}\n"
+            "Please write a short email based on the notes below following the dataset guidelines.\n"),
+        'edit_prefix': (
+            "Dataset guidelines: {guideline}\n"
+            "User preferences: {preference}\n"
+            "Please revise the base email below to better match both the dataset guidelines and user preferences. Focus on making the email more aligned with the user's preferred style while maintaining the key information.\n"),
+    },
+}
+STATIC_FIRST_TEMPLATES = {
+    task: dict(prefixes,
+               base=prefixes['base_prefix'] + "{label}:\n{input}",
+               edit=prefixes['edit_prefix'] + "{label}:\n{input}\nBase {output_name}:\n{output}")
+    for task, prefixes in _STATIC_FIRST_PREFIXES.items()
+}
+_STATIC_FIRST_LABELS = {
+    'summarization': {'label': 'Article', 'output_name': 'summary'},
+    'email_writing': {'label': 'Notes', 'output_name': 'email'},
+}
+
+PROMPT_LAYOUTS = ('article_first', 'static_first')
+
+
+class CompiledTemplate:
+    """A template parsed once into literal text and field slots, with static fields already bound."""
+    __slots__ = ('_literals', '_fields')
+
+    def __init__(self, text: str, **static):
+        literals, fields = [], []
+        literal = ''
+        for prefix, field, _, _ in Formatter().parse(text):
+            literal += prefix
+            if field is None:
+                continue
+            if field in static:
+                literal += static[field]
+            else:
+                literals.append(literal)
+                fields.append(field)
+                literal = ''
+        literals.append(literal)
+        self._literals = tuple(literals)
+        self._fields = tuple(fields)
+
+    def render(self, **values) -> str:
+        parts = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            parts.append(values[field])
+            parts.append(literal)
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=None)
+def _canonical_preference_str(preference: FrozenSet[AtomicIntent]) -> str:
+    return ", ".join(sorted(intent.value for intent in preference))
+
+
+def preference_to_str(preference: Union[None, str, Iterable[AtomicIntent]]) -> str:
+    """Canonical text for a preference: intents in sorted order, so the same user always
+    renders byte-identical prompts. Free-text (inferred) preferences are used as is."""
+    if preference is None:
+        return ""
+    if isinstance(preference, str):
+        return preference
+    return _canonical_preference_str(frozenset(preference))
+
+
+@lru_cache(maxsize=None)
+def compile_template(task: str, kind: str, dataset_type: Optional[str] = None,
+                     layout: str = 'article_first') -> Tuple[CompiledTemplate, ...]:
+    """Compile the template(s) of one (task, dataset_type, prompt kind, layout).
+
+    Returns a 1-tuple for single templates and a (head, item, tail) triple for list prompts.
+    """
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f'Unknown prompt layout {layout}. Supported layouts are: {list(PROMPT_LAYOUTS)}')
+    if task not in TEMPLATES:
+        raise ValueError(f"Unknown task: {task}. Supported tasks are: {list(TEMPLATES)}")
+    templates = TEMPLATES[task]
+    if layout == 'static_first' and kind in STATIC_FIRST_TEMPLATES[task]:
+        templates = STATIC_FIRST_TEMPLATES[task]
+    text = templates[kind]
+    static = dict(_STATIC_FIRST_LABELS[task], guideline=GLOBAL_GUIDELINES.get(task, {}).get(dataset_type, ""))
+    parts = text if isinstance(text, tuple) else (text,)
+    return tuple(CompiledTemplate(part, **static) for part in parts)
+
+
+class PromptTemplates:
+    """Renders the prompts of one task from precompiled, memoized templates."""
+
+    def __init__(self, task: str, layout: str = 'article_first'):
+        if layout not in PROMPT_LAYOUTS:
+            raise ValueError(f'Unknown prompt layout {layout}. Supported layouts are: {list(PROMPT_LAYOUTS)}')
+        self.task = task
+        self.layout = layout
+
+    def render(self, kind: str, dataset_type: Optional[str] = None,
+               preference: Union[None, str, Set[AtomicIntent]] = None, **fields) -> str:
+        template, = compile_template(self.task, kind, dataset_type, self.layout)
+        return template.render(preference=preference_to_str(preference), **fields)
+
+    def render_many(self, kind: str, dataset_type: Optional[str], rows: Iterable[Dict]) -> List[str]:
+        """Render one prompt per row (a dict of fields) against a single compiled template."""
+        template, = compile_template(self.task, kind, dataset_type, self.layout)
+        return [template.render(**dict(row, preference=preference_to_str(row.get('preference')))) for row in rows]
+
+    def render_list(self, kind: str, dataset_type: Optional[str], items: Iterable[Dict], **fields) -> str:
+        """Render a (head, item, tail) prompt: the item template once per element of `items`."""
+        head, item, tail = compile_template(self.task, kind, dataset_type, self.layout)
+        parts = [head.render(**fields)]
+        parts.extend(item.render(**entry) for entry in items)
+        parts.append(tail.render(**fields))
+        return ''.join(parts)
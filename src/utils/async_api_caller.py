@@ -0,0 +1,199 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional, List, Dict
+
+from src.utils.response_cache import ResponseCache, get_response_cache
+
+
+class TokenBucket:
+    """Token-bucket limiter that refills continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            async with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def refund(self, amount: float):
+        """Give back tokens that were reserved but not used (e.g. an overestimated completion)."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class AsyncAPIModelCaller:
+    """OpenAI chat caller with bounded concurrency, rate limiting and retries.
+
+    Requests run on an event loop owned by a background thread, so the caller
+    can be used from plain synchronous code (`caller(prompt)`, `caller.batch(prompts)`)
+    and from several threads at once while sharing one concurrency limit and
+    one pair of rate limiters.
+
+    Args:
+        model: The model to use (e.g., "gpt-4o-mini")
+        api_key: OpenAI API key
+        base_url: Optional endpoint override, e.g. a local stand-in server for testing
+        max_concurrency: Maximum number of requests in flight
+        requests_per_minute: Request budget for the request-rate limiter
+        tokens_per_minute: Token budget for the token-rate limiter
+        max_retries: Retries on 429, 5xx and connection errors before giving up
+        temperature: Sampling temperature
+        max_tokens: Maximum number of completion tokens
+    """
+    RETRY_BASE_DELAY = 1.0
+    RETRY_MAX_DELAY = 60.0
+
+    def __init__(self, model: str = "gpt-4o-mini", api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_concurrency: int = 16, requests_per_minute: float = 500, tokens_per_minute: float = 200000,
+                 max_retries: int = 6, temperature: float = 0.0, max_tokens: int = 4000, timeout: float = 120.0):
+        self.model = model
+        self.max_retries = max_retries
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self._client_kwargs = dict(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+        self._max_concurrency = max_concurrency
+        self._requests_per_minute = requests_per_minute
+        self._tokens_per_minute = tokens_per_minute
+        self._latencies = deque(maxlen=10000)
+        self._loop = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=f"api-caller-{self.model}", daemon=True).start()
+                # Loop-bound primitives have to be created on the loop that uses them
+                try:
+                    asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                except Exception:
+                    loop.call_soon_threadsafe(loop.stop)
+                    raise
+                self._loop = loop
+        return self._loop
+
+    async def _setup(self):
+        # Without an API key every call fails, as the synchronous caller does
+        if not self._client_kwargs["api_key"]:
+            self._client = None
+        else:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(**self._client_kwargs)
+        self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        self._request_bucket = TokenBucket(self._requests_per_minute)
+        self._token_bucket = TokenBucket(self._tokens_per_minute)
+
+    def _estimate_tokens(self, prompt: str) -> int:
+        # ~4 characters per token; the completion budget counts against the limit too
+        return len(prompt) // 4 + self.max_tokens
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Full jitter: uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2 ** attempt))
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        from openai import APIStatusError, APIConnectionError, APITimeoutError
+        if isinstance(error, (APIConnectionError, APITimeoutError)):
+            return True
+        return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+    async def acall(self, prompt: Optional[str]) -> Optional[str]:
+        """Call the model once; returns the response text or None if all attempts failed.
+
+        Temperature-0 calls go through the persistent response cache when it is
+        enabled, and identical prompts in flight at the same time share one request.
+        """
+        cache = get_response_cache() if self.temperature == 0 else None
+        if cache is None:
+            return await self._acall(prompt)
+        key = ResponseCache.make_key("openai", self.model, prompt, self.temperature, self.max_tokens)
+        return await cache.aget_or_compute(key, lambda: self._acall(prompt))
+
+    async def _acall(self, prompt: Optional[str]) -> Optional[str]:
+        if self._client is None:
+            print("Error: OpenAI client not initialized. Check your API key.")
+            return None
+        messages = []
+        if prompt:
+            messages.append({"role": "system", "content": prompt})
+        estimated_tokens = self._estimate_tokens(prompt or "")
+
+        for attempt in range(self.max_retries + 1):
+            await self._request_bucket.acquire(1)
+            await self._token_bucket.acquire(estimated_tokens)
+            async with self._semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await self._client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        max_tokens=self.max_tokens
+                    )
+                except Exception as e:
+                    # A failed request used none of its token budget
+                    self._token_bucket.refund(estimated_tokens)
+                    if attempt < self.max_retries and self._is_retryable(e):
+                        delay = self._retry_delay(attempt, e)
+                    else:
+                        print(f"Error calling {self.model}: {e}")
+                        return None
+                else:
+                    self._latencies.append(time.perf_counter() - start)
+                    if response.usage is not None:
+                        self._token_bucket.refund(max(0, estimated_tokens - response.usage.total_tokens))
+                    return response.choices[0].message.content
+            await asyncio.sleep(delay)
+        return None
+
+    async def abatch(self, prompts: List[str]) -> List[Optional[str]]:
+        return list(await asyncio.gather(*(self.acall(prompt) for prompt in prompts)))
+
+    def __call__(self, prompt: Optional[str], prefix: Optional[str] = None) -> Optional[str]:
+        # `prefix` is accepted for parity with the Hugging Face caller; the API caches shared prefixes itself
+        return asyncio.run_coroutine_threadsafe(self.acall(prompt), self._ensure_loop()).result()
+
+    def batch(self, prompts: List[str], **kwargs) -> List[Optional[str]]:
+        """Send all prompts concurrently (within the limits) and return responses in input order."""
+        return asyncio.run_coroutine_threadsafe(self.abatch(prompts), self._ensure_loop()).result()
+
+    def latency_stats(self) -> Dict[str, float]:
+        """Summary of per-call latencies (seconds) over the most recent successful calls."""
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return {"count": 0}
+        return {
+            "count": len(latencies),
+            "mean": sum(latencies) / len(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "max": latencies[-1],
+        }
@@ -1,88 +1,207 @@
 import json
-from typing import Optional, Dict
-from openai import OpenAI
+from functools import lru_cache
+from typing import Optional, Dict, List
 from pathlib import Path
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import re
-import torch
+import weakref
+from src.utils.response_cache import ResponseCache, get_response_cache
+
+# torch, transformers and openai are imported where they are first needed, so that
+# importing this module (e.g. for `main.py --show-stats`) stays fast
 
-# Load API keys from secrets.txt
 SECRET_FILE = 'secrets.txt'
-openai_key = None
 
-try:
-    with open(SECRET_FILE) as f:
-        lines = f.readlines()
-        for line in lines:
-            if line.split(',')[0].strip() == "openai_key":
-                openai_key = line.split(',')[1].strip()
-except FileNotFoundError:
-    print(f"Warning: {SECRET_FILE} not found. API calls will fail.")
 
-# Initialize API clients
-openai_client = OpenAI(api_key=openai_key) if openai_key else None
+@lru_cache(maxsize=None)
+def get_openai_key() -> Optional[str]:
+    """Read the OpenAI API key from secrets.txt on first use."""
+    try:
+        with open(SECRET_FILE) as f:
+            lines = f.readlines()
+            for line in lines:
+                if line.split(',')[0].strip() == "openai_key":
+                    return line.split(',')[1].strip()
+    except FileNotFoundError:
+        print(f"Warning: {SECRET_FILE} not found. API calls will fail.")
+    return None
+
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Synchronous OpenAI client, created on first use (None without an API key)."""
+    openai_key = get_openai_key()
+    if not openai_key:
+        return None
+    from openai import OpenAI
+    return OpenAI(api_key=openai_key)
+
+
+# Model instances are shared through the process-wide model registry
+_prefix_kv_caches: Dict[str, 'PrefixKVCache'] = {}  # Prefill of shared prompt prefixes, per HF model
+
+HF_MAX_NEW_TOKENS = 1024
+# Response cache backend of chat-templated HF generations; the single and batch paths share its entries
+HF_CACHE_BACKEND = "huggingface-chat"
+API_TEMPERATURE = 0.0
+API_MAX_TOKENS = 4000
+
+
+def call_huggingface_model(prompt: Optional[str] = None, model_name: str = "microsoft/Phi-4-mini-instruct", model_tokenizer: tuple = None,
+                           prefix: Optional[str] = None, variant: Optional[str] = None) -> Optional[str]:
+    """Call a Hugging Face model for text generation.
+
+    `model_tokenizer` is a (model, tokenizer) pair or a function that loads it on demand.
+    If `prompt` starts with a static `prefix` shared by other prompts, the prefill of
+    that prefix is computed once and reused from the prefix KV cache.
+    Responses are served from the persistent response cache when it is enabled; `variant`
+    (see `_model_variant`) keeps responses of differently loaded copies of a model apart.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return _call_huggingface_model(prompt, model_name, model_tokenizer, prefix)
+    # Decoding is greedy (do_sample=False), so the response is fully determined by the key
+    key = ResponseCache.make_key(HF_CACHE_BACKEND, _cache_model_name(model_name, variant), prompt, 0.0, HF_MAX_NEW_TOKENS)
+    return cache.get_or_compute(key, lambda: _call_huggingface_model(prompt, model_name, model_tokenizer, prefix))
 
-# Cache for model instances
-_model_cache: Dict[str, tuple] = {}  # (model, tokenizer) for HF models
 
-def call_huggingface_model(prompt: Optional[str] = None, model_name: str = "microsoft/Phi-4-mini-instruct", model_tokenizer: tuple = None) -> Optional[str]:
-    """Call a Hugging Face model for text generation (memory-efficient version using float16 on cuda:0)."""
+def _call_huggingface_model(prompt: Optional[str], model_name: str, model_tokenizer: Optional[tuple],
+                            prefix: Optional[str] = None) -> Optional[str]:
+    from src.utils.prefix_cache import PrefixKVCache, prefix_token_length
+    if model_tokenizer is None:
+        from src.utils.model_loading import shared_causal_lm
+        # No model held by the caller: borrow the shared one for this call
+        handle = shared_causal_lm(model_name)
+        try:
+            return _call_huggingface_model(prompt, model_name, handle.get, prefix)
+        finally:
+            handle.release()
     try:
-        if model_tokenizer is None:
-            # Load tokenizer
-            tokenizer = AutoTokenizer.from_pretrained(
-                model_name,
-                trust_remote_code=True,
-                padding_side="left"
-            )
-
-            # Load model in float16 and move to cuda:0
-            model = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                trust_remote_code=True,
-                torch_dtype=torch.float16
-            ).to("cuda:0")
-        else:
-            model, tokenizer = model_tokenizer
-
-        # Construct prompt
-        messages = []
-        if prompt:
-            messages.append({"role": "user", "content": prompt})
-        prompt_text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        model, tokenizer = model_tokenizer() if callable(model_tokenizer) else model_tokenizer
 
-        # Tokenize and move input to cuda
-        inputs = tokenizer(prompt_text, return_tensors="pt").to("cuda:0")
+        # Tokenized exactly as in the batch path, so both produce the same (cached) response
+        prompt_text = _chat_prompt_text(tokenizer, prompt)
+        inputs = tokenizer(prompt_text, return_tensors="pt", add_special_tokens=False).to(model.device)
 
-        outputs = model.generate(
-            **inputs,
+        prefix_len = prefix_token_length(tokenizer, prompt_text, prefix, add_special_tokens=False)
+        outputs = _prefix_kv_caches.setdefault(model_name, PrefixKVCache()).generate(
+            model,
+            inputs,
+            prefix_len,
             pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
             eos_token_id=tokenizer.eos_token_id,
-            max_new_tokens=1024,
+            max_new_tokens=HF_MAX_NEW_TOKENS,
+            # Greedy regardless of the model's generation config, which may sample
+            do_sample=False,
         )
 
-        # Decode output
-        full_output = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        return _decode_generated(tokenizer, outputs, inputs["input_ids"].shape[1])[0]
 
-        if "llama" in model_name.lower():
-            split_token = "assistant\n\n"
-            if split_token in full_output.lower():
-                idx = full_output.lower().rfind(split_token)
-                full_output = full_output[idx + len(split_token):].strip()
+    except Exception as e:
+        print(f"Error calling {model_name}: {e}")
+        return None
 
-            result = full_output
-        else: 
-            full_output = re.sub(r'^[Aa]ssistant\s*\n+', '', full_output, count=1).strip()
 
-            # Remove prompt from output if duplicated
-            response = full_output.replace(messages[0]["content"], "").strip()
-            result = response if response else full_output.strip()
+def _model_variant(handle) -> str:
+    """Device, dtype and quantization a shared model is loaded with (the tail of its registry key)."""
+    return ','.join(str(part) for part in handle.key[2:])
 
-        return result
 
-    except Exception as e:
-        print(f"Error calling {model_name}: {e}")
-        return None
+def _cache_model_name(model_name: str, variant: Optional[str]) -> str:
+    # Outputs differ between e.g. fp16 and int8 copies of a model, so they are cached apart
+    return f'{model_name}@{variant}' if variant else model_name
+
+
+def _chat_prompt_text(tokenizer, prompt: Optional[str]) -> str:
+    """The prompt wrapped in the model's chat template. The template adds any BOS token, so
+    the text is tokenized with add_special_tokens=False."""
+    messages = [{"role": "user", "content": prompt}] if prompt else []
+    return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+
+def _decode_generated(tokenizer, outputs, input_len: int) -> List[str]:
+    # generate returns the prompt followed by the new tokens; only the new tokens are the response
+    return [text.strip() for text in tokenizer.batch_decode(outputs[:, input_len:], skip_special_tokens=True)]
+
+
+def _bucket_by_length(lengths: List[int], max_batch_tokens: int, max_new_tokens: int) -> List[List[int]]:
+    """Group indices into buckets of similar length whose padded size fits the token budget.
+
+    Each bucket is padded to its longest prompt, so the cost of a bucket is
+    ``len(bucket) * (longest_prompt + max_new_tokens)``. Indices are visited
+    from longest to shortest, which keeps padding inside a bucket small.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    buckets, current, current_len = [], [], 0
+    for i in order:
+        # The first index of a bucket is its longest one
+        padded_len = (current_len or lengths[i]) + max_new_tokens
+        if current and (len(current) + 1) * padded_len > max_batch_tokens:
+            buckets.append(current)
+            current, current_len = [], 0
+        if not current:
+            current_len = lengths[i]
+        current.append(i)
+    if current:
+        buckets.append(current)
+    return buckets
+
+
+def call_huggingface_model_batch(prompts: List[str], model_name: str, model_tokenizer: tuple,
+                                 max_batch_tokens: int = 16384, max_new_tokens: int = HF_MAX_NEW_TOKENS,
+                                 variant: Optional[str] = None) -> List[Optional[str]]:
+    """Generate completions for several prompts with one ``generate`` pass per length bucket.
+
+    Args:
+        prompts: User prompts, each wrapped in the model's chat template
+        model_name: Name of the Hugging Face model (used in error messages)
+        model_tokenizer: The (model, tokenizer) pair, or a function that loads it; the tokenizer must pad on the left
+        max_batch_tokens: Upper bound on padded prompt plus generated tokens per bucket
+        max_new_tokens: Maximum number of tokens to generate for each prompt
+        variant: How the model is loaded, part of the response cache key (see `call_huggingface_model`)
+
+    Returns:
+        The responses in the same order as ``prompts`` (None for a failed bucket)
+    """
+    results: List[Optional[str]] = [None] * len(prompts)
+    cache = get_response_cache()
+    cache_model_name = _cache_model_name(model_name, variant)
+    keys = [ResponseCache.make_key(HF_CACHE_BACKEND, cache_model_name, prompt, 0.0, max_new_tokens) for prompt in prompts]
+    if cache is not None:
+        results = [cache.get(key) for key in keys]
+    # Only prompts missing from the cache are generated
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    import torch
+    model, tokenizer = model_tokenizer() if callable(model_tokenizer) else model_tokenizer
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+    prompt_texts = [_chat_prompt_text(tokenizer, prompts[i]) for i in pending]
+    lengths = [len(ids) for ids in tokenizer(prompt_texts, add_special_tokens=False)["input_ids"]]
+
+    for bucket in _bucket_by_length(lengths, max_batch_tokens, max_new_tokens):
+        try:
+            inputs = tokenizer([prompt_texts[i] for i in bucket], return_tensors="pt", padding=True,
+                               add_special_tokens=False).to(model.device)
+            with torch.no_grad():
+                outputs = model.generate(
+                    **inputs,
+                    pad_token_id=pad_token_id,
+                    eos_token_id=tokenizer.eos_token_id,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=False,
+                )
+            # With left padding every prompt ends at the same position, so the
+            # generated tokens are everything after the padded input length
+            for j, text in zip(bucket, _decode_generated(tokenizer, outputs, inputs["input_ids"].shape[1])):
+                results[pending[j]] = text
+                if cache is not None:
+                    cache.put(keys[pending[j]], results[pending[j]])
+        except Exception as e:
+            print(f"Error calling {model_name} on a batch of {len(bucket)} prompts: {e}")
+    return results
 
 
 
@@ -96,6 +215,15 @@ def call_api_model(prompt: Optional[str] = None, model: str = "gpt-4o-mini") ->
     Returns:
         The model's response text or None if there was an error
     """
+    cache = get_response_cache()
+    if cache is None:
+        return _call_api_model(prompt, model)
+    key = ResponseCache.make_key("openai", model, prompt, API_TEMPERATURE, API_MAX_TOKENS)
+    return cache.get_or_compute(key, lambda: _call_api_model(prompt, model))
+
+
+def _call_api_model(prompt: Optional[str], model: str) -> Optional[str]:
+    openai_client = get_openai_client()
     if not openai_client:
         print("Error: OpenAI client not initialized. Check your API key.")
         return None
@@ -108,49 +236,61 @@ def call_api_model(prompt: Optional[str] = None, model: str = "gpt-4o-mini") ->
         response = openai_client.chat.completions.create(
             model=model,
             messages=messages,
-            temperature=0.0,
-            max_tokens=4000
+            temperature=API_TEMPERATURE,
+            max_tokens=API_MAX_TOKENS
         )
         return response.choices[0].message.content
     except Exception as e:
         print(f"Error calling {model}: {e}")
         return None 
 
-def create_model_caller(model_name: str = "gpt-4o-mini"):
+def create_model_caller(model_name: str = "gpt-4o-mini", max_concurrency: int = 16,
+                        requests_per_minute: float = 500, tokens_per_minute: float = 200000,
+                        base_url: Optional[str] = None, device: str = "auto", dtype: str = "auto",
+                        quantize: Optional[str] = None, num_threads: Optional[int] = None):
     """Create a model caller function with the specified model
     
     Args:
         model_name: Name of the model to use
+        max_concurrency: Maximum number of API requests in flight (API models only)
+        requests_per_minute: Request rate limit (API models only)
+        tokens_per_minute: Token rate limit (API models only)
+        base_url: Optional API endpoint override, e.g. a local stand-in server (API models only)
+        device: 'auto', 'cpu' or a CUDA device (Hugging Face models only)
+        dtype: 'auto', 'fp16', 'bf16' or 'fp32' (Hugging Face models only)
+        quantize: None or 'int8' (Hugging Face models only)
+        num_threads: Number of CPU threads for inference (Hugging Face models only)
         
     Returns:
-        A function that takes (prompt, input_text) and returns the model's response
+        A function that takes a prompt and returns the model's response. It also
+        exposes ``batch(prompts, ...)`` to generate several prompts at once.
     """
     # Check if the model is a Hugging Face model
     if "/" in model_name:  # Hugging Face models typically have a "/" in their name
-        # Check if model is already in cache
-        if model_name not in _model_cache:
-            # print(f"Loading model {model_name} into cache...")
-            # Load tokenizer
-            tokenizer = AutoTokenizer.from_pretrained(
-                model_name,
-                trust_remote_code=True,
-                padding_side="left"
-            )
-            # Load model in float16 and move to cuda:0
-            model = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                trust_remote_code=True,
-                torch_dtype=torch.float16
-            ).to("cuda:0")
-            _model_cache[model_name] = (model, tokenizer)
-            # print(f"Model {model_name} loaded and cached.")
-        # else:
-        #     print(f"Using cached model {model_name}")
-        
-        def model_caller(prompt: str) -> str:
-            return call_huggingface_model(prompt=prompt, model_name=model_name, model_tokenizer=_model_cache[model_name])
+        # The shared model is loaded on the first call that misses the response cache
+        from src.utils.model_loading import shared_causal_lm
+        handle = shared_causal_lm(model_name, device=device, dtype=dtype, quantize=quantize, num_threads=num_threads)
+        load = handle.get
+        variant = _model_variant(handle)
+
+        def model_caller(prompt: str, prefix: Optional[str] = None) -> str:
+            return call_huggingface_model(prompt=prompt, model_name=model_name, model_tokenizer=load, prefix=prefix,
+                                          variant=variant)
+
+        def batch(prompts: List[str], max_batch_tokens: int = 16384, max_new_tokens: int = HF_MAX_NEW_TOKENS) -> List[Optional[str]]:
+            return call_huggingface_model_batch(prompts, model_name=model_name, model_tokenizer=load,
+                                                max_batch_tokens=max_batch_tokens, max_new_tokens=max_new_tokens,
+                                                variant=variant)
     else:  # Assume it's an API model
-        def model_caller(prompt: str) -> str:
-            return call_api_model(prompt=prompt, model=model_name)
-    
+        # Requests run concurrently on a background event loop, within the rate limits
+        from src.utils.async_api_caller import AsyncAPIModelCaller
+        return AsyncAPIModelCaller(model=model_name, api_key=get_openai_key(), base_url=base_url,
+                                   max_concurrency=max_concurrency, requests_per_minute=requests_per_minute,
+                                   tokens_per_minute=tokens_per_minute)
+
+    # Batched entry point: model_caller.batch(prompts, ...) returns results in input order
+    model_caller.batch = batch
+    # The caller holds its reference to the shared model until it is garbage collected
+    model_caller.model_handle = handle
+    weakref.finalize(model_caller, handle.release)
     return model_caller 
\ No newline at end of file
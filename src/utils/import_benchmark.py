@@ -0,0 +1,73 @@
+"""Import-time benchmark for the modules on the CLI's startup path.
+
+Each module is imported in a fresh interpreter, so timings include everything it pulls in.
+Exits non-zero if a module exceeds the time budget or imports one of the heavy libraries
+that are meant to be loaded lazily, which makes it usable as a regression check:
+
+    python -m src.utils.import_benchmark --budget 1.0
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, List
+
+MODULES = [
+    'main',
+    'src.utils.call_llm_helpers',
+    'src.utils.logs',
+    'src.task.dataset_helpers',
+    'src.task.intent_handler',
+    'src.task.prompt_templates',
+]
+
+# Libraries that must not be imported by merely importing the modules above
+HEAVY_MODULES = ['torch', 'transformers', 'openai', 'datasets', 'pandas', 'ipywidgets', 'nltk']
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeats: int = 3) -> Dict:
+    """Best-of-`repeats` import time of `module` in a fresh interpreter, and the heavy libraries it loaded."""
+    best = None
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {'module': module, 'error': proc.stderr.strip().splitlines()[-1] if proc.stderr else 'failed'}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return dict(best, module=module)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Measure import time of the CLI startup modules')
+    parser.add_argument('--budget', type=float, default=1.0, help='Maximum import time per module in seconds')
+    parser.add_argument('--repeats', type=int, default=3, help='Imports per module; the fastest one is reported')
+    parser.add_argument('modules', nargs='*', default=MODULES, help='Modules to measure')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        result = measure(module, args.repeats)
+        if 'error' in result:
+            print(f'{module:<32} ERROR  {result["error"]}')
+            failed = True
+            continue
+        over_budget = result['seconds'] > args.budget
+        status = 'SLOW' if over_budget else ('HEAVY' if result['heavy'] else 'ok')
+        heavy = f'  imports {", ".join(result["heavy"])}' if result['heavy'] else ''
+        print(f'{module:<32} {result["seconds"] * 1000:8.1f} ms  {status}{heavy}')
+        failed = failed or over_budget or bool(result['heavy'])
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
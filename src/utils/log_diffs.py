@@ -0,0 +1,113 @@
+"""Completion-vs-edited diffs of workspace logs.
+
+`compute_diff` returns the semantically cleaned-up diff_match_patch diff of two texts,
+keeping the most recent ones in an LRU cache. `precompute_diffs` diffs every record of a
+log ahead of time, across a process pool, and saves the diffs next to the log
+(`<log>.diffs.ndjson`); `load_diffs` makes them available to `compute_diff`, so the log
+viewer only looks them up.
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# A diff: (flag, text) pairs, flag being diff_match_patch's DIFF_DELETE/DIFF_EQUAL/DIFF_INSERT
+DiffOps = Tuple[Tuple[int, str], ...]
+
+DIFF_CACHE_SIZE = 256
+
+# Logs with fewer new pairs than this are diffed in-process
+MIN_PARALLEL_BATCH = 64
+
+# Diffs loaded by `load_diffs`, by `diff_key`
+_precomputed: Dict[str, DiffOps] = {}
+
+
+def diffs_path_for(log_path) -> Path:
+    """Precomputed diffs of a log: `<log>.diffs.ndjson`, next to the (uncompressed) log path."""
+    from src.workspace.log_writer import COMPRESSION_SUFFIXES
+    name = Path(log_path).name
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if suffix and name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return Path(log_path).with_name(name + '.diffs.ndjson')
+
+
+def diff_key(old: str, new: str) -> str:
+    return hashlib.sha256(f'{len(old)}:{old}{new}'.encode('utf-8')).hexdigest()
+
+
+def _diff(old: str, new: str) -> DiffOps:
+    import diff_match_patch as dmp_module
+    dmp = dmp_module.diff_match_patch()
+    diff = dmp.diff_main(old, new)
+    dmp.diff_cleanupSemantic(diff)
+    return tuple((flag, text) for flag, text in diff)
+
+
+@lru_cache(maxsize=DIFF_CACHE_SIZE)
+def compute_diff(old: str, new: str) -> DiffOps:
+    """Diff of two texts: precomputed if loaded with `load_diffs`, else computed now."""
+    precomputed = _precomputed.get(diff_key(old, new)) if _precomputed else None
+    return precomputed if precomputed is not None else _diff(old, new)
+
+
+def _diff_pair(pair: Tuple[str, str]) -> DiffOps:
+    return _diff(*pair)
+
+
+def _read_diffs(path: Path) -> Dict[str, DiffOps]:
+    diffs = {}
+    if path.exists():
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                # A line cut short by an interrupted precompute is skipped
+                if line.endswith('\n'):
+                    record = json.loads(line)
+                    diffs[record['key']] = tuple((flag, text) for flag, text in record['diff'])
+    return diffs
+
+
+def precompute_diffs(log_path, old_key: str = 'completion', new_key: str = 'edited',
+                     num_workers: Optional[int] = None, chunksize: int = 16) -> Path:
+    """
+    Diff `old_key` against `new_key` in every record of a log and append the diffs to
+    `diffs_path_for(log_path)`. Pairs diffed before (or repeated in the log) are diffed once.
+    :param num_workers: size of the process pool (os.cpu_count() if None); 0 or 1 diffs in-process
+    :return: path of the diffs file
+    """
+    from src.utils.log_parquet import iter_log_records
+    path = diffs_path_for(log_path)
+    done = set(_read_diffs(path))
+    pairs = {}
+    for record in iter_log_records(log_path):
+        old, new = record.get(old_key), record.get(new_key)
+        if isinstance(old, str) and isinstance(new, str):
+            key = diff_key(old, new)
+            if key not in done:
+                pairs.setdefault(key, (old, new))
+    num_workers = os.cpu_count() if num_workers is None else num_workers
+    pool = None
+    if num_workers <= 1 or len(pairs) < MIN_PARALLEL_BATCH:
+        diffs = map(_diff_pair, pairs.values())
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=num_workers)
+        diffs = pool.map(_diff_pair, pairs.values(), chunksize=chunksize)
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            for key, diff in zip(pairs, diffs):
+                f.write(json.dumps({'key': key, 'diff': diff}) + '\n')
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return path
+
+
+def load_diffs(log_path) -> int:
+    """Make the precomputed diffs of a log available to `compute_diff`; returns how many were loaded."""
+    diffs = _read_diffs(diffs_path_for(log_path))
+    _precomputed.update(diffs)
+    return len(diffs)
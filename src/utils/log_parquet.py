@@ -0,0 +1,162 @@
+"""Parquet storage for workspace logs.
+
+`convert_logs_to_parquet` turns an ndjson log (rotated, compressed and blob-deduplicated
+logs included) into a Parquet file with typed columns: scalar metrics become int/float/
+bool/string columns, logprob lists become list<float> columns, and conversations become
+JSON text columns. `load_logs_parquet` reads it back into `Logs`, reading only the
+selected columns and pushing row filters down to the Parquet reader, so e.g. a cost curve
+over a large sweep reads a few scalar columns instead of every prompt and conversation.
+
+pyarrow is imported on first use.
+"""
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+# Long texts and nested values: only read when selected explicitly (or with include_texts)
+TEXT_COLUMNS = ('message', 'completion', 'edited', 'comment', 'rag_doc')
+JSON_COLUMNS = ('conversation',)
+
+
+def parquet_path_for(log_path) -> Path:
+    """Default Parquet file for a log: the log path with its .ndjson(.gz/.zst) suffix replaced by .parquet."""
+    name = Path(log_path).name
+    for suffix in ('.gz', '.zst', '.ndjson', '.jsonl', '.json'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return Path(log_path).with_name(name + '.parquet')
+
+
+def iter_log_records(log_path) -> Iterator[Dict]:
+    """Records of a (possibly rotated and compressed) log, with texts from its blob store filled in."""
+    from src.workspace.blob_store import BlobStore, blob_dir_for, materialize
+    from src.workspace.log_writer import log_files, open_log_file
+    blob_dir = blob_dir_for(log_path)
+    blobs = BlobStore(blob_dir) if blob_dir.exists() else None
+    for part in log_files(log_path) or [log_path]:
+        with open_log_file(part) as f:
+            for line in f:
+                record = json.loads(line)
+                yield materialize(blobs.resolve(record)) if blobs else record
+
+
+def _iter_records_raw(log_path) -> Iterator[Dict]:
+    # Records without resolving blob pointers: enough to infer column types
+    from src.workspace.log_writer import log_files, open_log_file
+    for part in log_files(log_path) or [log_path]:
+        with open_log_file(part) as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def _is_pointer(value) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and '$blob' in value
+
+
+def _column_kind(values: set) -> str:
+    """Parquet column kind for the set of Python types seen in a column."""
+    values.discard(type(None))
+    if not values:
+        return 'string'
+    if values <= {bool}:
+        return 'bool'
+    if values <= {int}:
+        return 'int'
+    if values <= {int, float}:
+        return 'float'
+    if values <= {str}:
+        return 'string'
+    if values <= {'numeric_list'}:
+        return 'float_list'
+    return 'json'
+
+
+def _infer_kinds(log_path) -> Dict[str, str]:
+    seen: Dict[str, set] = {}
+    for record in _iter_records_raw(log_path):
+        for key, value in record.items():
+            if _is_pointer(value):
+                kind = str
+            elif isinstance(value, list) and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+                kind = 'numeric_list'
+            else:
+                kind = type(value)
+            seen.setdefault(key, set()).add(kind)
+    kinds = {key: _column_kind(types) for key, types in seen.items()}
+    for key in JSON_COLUMNS:
+        if key in kinds:
+            kinds[key] = 'json'
+    return kinds
+
+
+def _schema(kinds: Dict[str, str]):
+    import pyarrow as pa
+    types = {'bool': pa.bool_(), 'int': pa.int64(), 'float': pa.float64(), 'string': pa.string(),
+             'float_list': pa.list_(pa.float64()), 'json': pa.string()}
+    return pa.schema([(key, types[kind]) for key, kind in kinds.items()])
+
+
+def _normalize(record: Dict, kinds: Dict[str, str]) -> Dict:
+    row = {}
+    for key, kind in kinds.items():
+        value = record.get(key)
+        if value is None:
+            row[key] = None
+        elif kind == 'json':
+            row[key] = json.dumps(value)
+        elif kind == 'float':
+            row[key] = float(value)
+        elif kind == 'float_list':
+            row[key] = [float(v) for v in value]
+        else:
+            row[key] = value
+    return row
+
+
+def convert_logs_to_parquet(log_path, parquet_path=None, row_group_size: int = 8192) -> Path:
+    """
+    Convert an ndjson workspace log to Parquet, streaming it in row groups of `row_group_size` records.
+    Returns the path of the Parquet file (next to the log by default).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    parquet_path = Path(parquet_path) if parquet_path else parquet_path_for(log_path)
+    kinds = _infer_kinds(log_path)
+    schema = _schema(kinds)
+    with pq.ParquetWriter(str(parquet_path), schema, compression='zstd') as writer:
+        batch = []
+        for record in iter_log_records(log_path):
+            batch.append(_normalize(record, kinds))
+            if len(batch) == row_group_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch or not kinds:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    return parquet_path
+
+
+def load_logs_parquet(path, columns: Optional[Sequence[str]] = None, filters: Optional[List] = None,
+                      include_texts: bool = False):
+    """
+    Load a Parquet log as `Logs`.
+
+    Args:
+        path: Parquet file written by `convert_logs_to_parquet`
+        columns: Columns to read; by default every column except long texts and conversations
+        filters: Row filters in pyarrow's DNF form, e.g. [('cost', '>', 0)], applied by the reader
+        include_texts: Also read the text and conversation columns when `columns` is not given
+
+    Returns:
+        A Logs frame; conversation columns are decoded back to lists
+    """
+    import pyarrow.parquet as pq
+    from src.utils.logs import Logs
+    if columns is None:
+        names = pq.read_schema(str(path)).names
+        lazy = set(TEXT_COLUMNS) | set(JSON_COLUMNS)
+        columns = names if include_texts else [name for name in names if name not in lazy]
+    frame = pq.read_table(str(path), columns=list(columns), filters=filters).to_pandas()
+    for key in JSON_COLUMNS:
+        if key in frame.columns:
+            frame[key] = frame[key].map(lambda value: json.loads(value) if value is not None else [])
+    return Logs(frame)
@@ -1,39 +1,63 @@
-from ipywidgets import HTML, VBox, widgets, Layout, HBox, interactive
 import diff_match_patch as dmp_module
 import json
-import pandas as pd
+from functools import lru_cache
+
+from src.utils.log_diffs import DIFF_CACHE_SIZE
+
+# ipywidgets and pandas are slow to import and only needed in notebooks, so they are
+# imported on first use; `Logs` (a pandas DataFrame subclass) is built on first access
 
 class Diff:
+    """Diff of two texts, computed (or looked up, see src.utils.log_diffs) on first use."""
     def __init__(self, old, new, title_old, title_new):
-        self.dmp = dmp_module.diff_match_patch()
-        self.diff = self.dmp.diff_main(old, new)
-        self.dmp.diff_cleanupSemantic(self.diff)
+        self.old = old
+        self.new = new
         self.title_old = title_old
         self.title_new = title_new
 
+    @property
+    def diff(self):
+        from src.utils.log_diffs import compute_diff
+        return compute_diff(self.old, self.new)
+
     @property
     def inplace(self):
-        return HTML(f'<header><h3>{self.title_old} vs {self.title_new}</h3></header>{self.dmp.diff_prettyHtml(self.diff)}')
+        from ipywidgets import HTML
+        html, = _diff_html(self.old, self.new, self.title_old, self.title_new, 'inplace')
+        return HTML(html)
     
     @property
     def side_by_side(self):
-        def _translate(flag, data):
-            text = data.translate(str.maketrans({"&": "&amp;","<": "&lt;",">": "&gt;","\n": "<br>"}))
-            if flag == dmp_module.diff_match_patch.DIFF_DELETE:
-                return flag, f'<del style="background:#ffe6e6;">{text}</del>'
-            if flag == dmp_module.diff_match_patch.DIFF_INSERT:
-                return flag, f'<ins style="background:#e6ffe6;">{text}</ins>'
-            elif flag == dmp_module.diff_match_patch.DIFF_EQUAL:
-                return flag, f'<span>{text}</span>'
-        translated = [_translate(flag, data) for (flag, data) in self.diff]
-        old = "".join([t for (f, t) in translated if f != dmp_module.diff_match_patch.DIFF_INSERT])
-        new = "".join([t for (f, t) in translated if f != dmp_module.diff_match_patch.DIFF_DELETE])
-        return HBox([
-            HTML(f'<header><h3>{self.title_old}</h3></header>{old}'),
-            HTML(f'<header><h3>{self.title_new}</h3></header>{new}')], layout = Layout(justify_content = 'space-around'))
+        from ipywidgets import HTML, HBox, Layout
+        old, new = _diff_html(self.old, self.new, self.title_old, self.title_new, 'side-by-side')
+        return HBox([HTML(old), HTML(new)], layout = Layout(justify_content = 'space-around'))
+
+
+@lru_cache(maxsize=DIFF_CACHE_SIZE)
+def _diff_html(old, new, title_old, title_new, mode):
+    # Rendered HTML of the most recently viewed diffs
+    from src.utils.log_diffs import compute_diff
+    diff = compute_diff(old, new)
+    if mode == 'inplace':
+        return f'<header><h3>{title_old} vs {title_new}</h3></header>{dmp_module.diff_match_patch().diff_prettyHtml(diff)}',
+
+    def _translate(flag, data):
+        text = data.translate(str.maketrans({"&": "&amp;","<": "&lt;",">": "&gt;","\n": "<br>"}))
+        if flag == dmp_module.diff_match_patch.DIFF_DELETE:
+            return flag, f'<del style="background:#ffe6e6;">{text}</del>'
+        if flag == dmp_module.diff_match_patch.DIFF_INSERT:
+            return flag, f'<ins style="background:#e6ffe6;">{text}</ins>'
+        elif flag == dmp_module.diff_match_patch.DIFF_EQUAL:
+            return flag, f'<span>{text}</span>'
+    translated = [_translate(flag, data) for (flag, data) in diff]
+    old = "".join([t for (f, t) in translated if f != dmp_module.diff_match_patch.DIFF_INSERT])
+    new = "".join([t for (f, t) in translated if f != dmp_module.diff_match_patch.DIFF_DELETE])
+    return f'<header><h3>{title_old}</h3></header>{old}', f'<header><h3>{title_new}</h3></header>{new}'
 
         
 def dict2html(d):
+    from ipywidgets import HTML
+
     def _with_br(text):
         return str(text).replace('\n', '<br/>')
     table = "".join([f"<tr><td>{k}</td><td>{_with_br(v)}</td></tr>" for k,v in d.items()])
@@ -43,16 +67,26 @@ class Row(dict):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+    def __getitem__(self, key):
+        # Texts stored in the log's blob store are loaded here, on first access
+        from src.workspace.blob_store import BlobRef
+        value = super().__getitem__(key)
+        return value.text if isinstance(value, BlobRef) else value
+
     def __str__(self) -> str:
         return f'Cost: {self["cost"]}--------{self["message"][:128]}...'
 
     def view(self, mode = 'side-by-side'):
+        from ipywidgets import HTML, VBox, widgets
+
         def _html(section):
             return HTML(value=f"<header><h3>{section}</h3></header>{self[section]}")
     
         def _view(mode):
+            from src.workspace.blob_store import materialize
             if mode == 'raw':
-                return dict2html(self)
+                # Values (nested ones too) may be blob store refs: show their texts
+                return dict2html(materialize(dict(self)))
             diff = Diff(self["completion"], self["edited"], 'completion', 'edited')
             view = {
                 "comment": self['comment'],
@@ -63,7 +97,8 @@ class Row(dict):
                 "preference.inference": self['preference_inference'],
                 "preference.groundtruth": self['preference_groundtruth'],
             }
-            conversation = self.get('conversation', [])
+            # Nested texts may still be blob store refs: render a copy with their texts
+            conversation = materialize(self.get('conversation', []))
             for c in conversation:
                 c['q'] = c['q'] if isinstance(c['q'], str) else c['q'][1]['content']
             return VBox(
@@ -78,24 +113,109 @@ class Row(dict):
         return _view(mode)
 
 
-class Logs(pd.DataFrame):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+class LogViewer:
+    """
+    Paginated viewer of a Logs frame: one page of `page_size` collapsed rows at a time, a row
+    being rendered (diff included) only when it is expanded.
+    """
+    def __init__(self, logs, mode = 'side-by-side', page_size = 20):
+        from ipywidgets import HTML, Button, HBox, VBox, widgets
+        self.logs = logs
+        self.mode = mode
+        self.page_size = page_size
+        self.page = 0
+        self._rows = []
+        self._rendered = set()
+        self._accordion = widgets.Accordion()
+        self._accordion.observe(self._on_select, names='selected_index')
+        self._prev = Button(description='Previous')
+        self._next = Button(description='Next')
+        self._prev.on_click(lambda _: self.show(self.page - 1))
+        self._next.on_click(lambda _: self.show(self.page + 1))
+        self._label = HTML()
+        self.widget = VBox([HBox([self._prev, self._label, self._next]), self._accordion])
+        self.show(0)
 
-    @staticmethod
-    def load(path):
-        with open(path, 'r') as f:
-            return Logs(map(lambda line: Row(json.loads(line)), f))
+    @property
+    def num_pages(self):
+        return max(1, -(-len(self.logs) // self.page_size))
 
-    def __getitem__(self, i):
-        result = super().__getitem__(i)
-        return Logs(result) if isinstance(i, pd.core.series.Series) else result
+    def show(self, page):
+        from ipywidgets import HTML
+        self.page = min(max(page, 0), self.num_pages - 1)
+        start = self.page * self.page_size
+        page_logs = self.logs.iloc[start:start + self.page_size]
+        self._rows = [(i, Row(row)) for i, row in page_logs.iterrows()]
+        self._rendered = set()
+        self._accordion.selected_index = None
+        self._accordion.children = [HTML() for _ in self._rows]
+        self._accordion.titles = tuple(f'{i}. {str(row)}' for i, row in self._rows)
+        self._label.value = f'Page {self.page + 1} / {self.num_pages} ({len(self.logs)} rows)'
+        self._prev.disabled = self.page == 0
+        self._next.disabled = self.page == self.num_pages - 1
+
+    def _on_select(self, change):
+        index = change['new']
+        if index is None or index in self._rendered:
+            return
+        self._rendered.add(index)
+        children = list(self._accordion.children)
+        children[index] = self._rows[index][1].view(self.mode)
+        self._accordion.children = children
+        self._accordion.selected_index = index
+
+    def _repr_mimebundle_(self, **kwargs):
+        return self.widget._repr_mimebundle_(**kwargs)
+
+
+def _make_logs_class():
+    import pandas as pd
+
+    class Logs(pd.DataFrame):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+
+        @staticmethod
+        def load(path):
+            # A log may be rotated into several parts and gzip/zstd compressed
+            from src.workspace.blob_store import BlobStore, blob_dir_for
+            from src.workspace.log_writer import log_files, open_log_file
+            # Texts moved to the blob store are read only when they are accessed
+            blob_dir = blob_dir_for(path)
+            blobs = BlobStore(blob_dir) if blob_dir.exists() else None
+            rows = []
+            for part in log_files(path) or [path]:
+                with open_log_file(part) as f:
+                    for line in f:
+                        record = json.loads(line)
+                        rows.append(Row(blobs.resolve(record) if blobs else record))
+            # Diffs saved by src.utils.log_diffs.precompute_diffs are looked up instead of computed
+            from src.utils.log_diffs import diffs_path_for, load_diffs
+            if diffs_path_for(path).exists():
+                load_diffs(path)
+            return Logs(rows)
+
+        @staticmethod
+        def load_parquet(path, columns=None, filters=None, include_texts=False):
+            # Columnar logs written by src.utils.log_parquet.convert_logs_to_parquet
+            from src.utils.log_parquet import load_logs_parquet
+            return load_logs_parquet(path, columns=columns, filters=filters, include_texts=include_texts)
+
+        def __getitem__(self, i):
+            result = super().__getitem__(i)
+            return Logs(result) if isinstance(i, pd.core.series.Series) else result
     
-    def sort_values(self, *args, **kwargs):
-        return Logs(super().sort_values(*args, **kwargs))
+        def sort_values(self, *args, **kwargs):
+            return Logs(super().sort_values(*args, **kwargs))
     
-    def view(self, mode = 'side-by-side'):
-        i_row = [(i, Row(row)) for i, row in self.iterrows()]
-        return widgets.Accordion(
-            children=[row.view(mode) for i, row in i_row],
-            titles = [f'{i}. {str(row)}' for i, row in i_row])
+        def view(self, mode = 'side-by-side', page_size = 20):
+            return LogViewer(self, mode, page_size)
+
+    return Logs
+
+
+def __getattr__(name):
+    if name == 'Logs':
+        globals()['Logs'] = _make_logs_class()
+        return globals()['Logs']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
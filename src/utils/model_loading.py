@@ -0,0 +1,109 @@
+import resource
+import sys
+import time
+from typing import Optional, Tuple
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from src.utils.model_registry import ModelHandle, get_model_registry
+
+_DTYPES = {
+    'fp16': torch.float16, 'float16': torch.float16,
+    'bf16': torch.bfloat16, 'bfloat16': torch.bfloat16,
+    'fp32': torch.float32, 'float32': torch.float32,
+}
+
+
+def resolve_device(device: str = 'auto') -> str:
+    """Map 'auto' to the first GPU if there is one, otherwise the CPU."""
+    if device == 'auto':
+        return 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    if device.startswith('cuda') and not torch.cuda.is_available():
+        raise ValueError(f'Device {device} requested but CUDA is not available')
+    return device
+
+
+def resolve_dtype(dtype: str, device: str) -> torch.dtype:
+    """Map a dtype name to a torch dtype; 'auto' is float16 on GPU and float32 on CPU."""
+    if dtype == 'auto':
+        return torch.float16 if device.startswith('cuda') else torch.float32
+    if dtype not in _DTYPES:
+        raise ValueError(f'Unknown dtype {dtype}. Supported dtypes are: {sorted(_DTYPES)}')
+    return _DTYPES[dtype]
+
+
+def resident_memory_mb() -> float:
+    """Current resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB on Linux
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def load_causal_lm(model_name: str, device: str = 'auto', dtype: str = 'auto', quantize: Optional[str] = None,
+                   num_threads: Optional[int] = None, padding_side: Optional[str] = 'left') -> Tuple[torch.nn.Module, object]:
+    """Load a Hugging Face causal LM and its tokenizer on the requested device.
+
+    Args:
+        model_name: Name or path of the Hugging Face model
+        device: 'auto', 'cpu', 'cuda', 'cuda:N' or 'mps'
+        dtype: 'auto', 'fp16', 'bf16' or 'fp32'
+        quantize: None or 'int8'. On CPU this applies dynamic int8 quantization to the
+            linear layers; on GPU it loads 8-bit weights through bitsandbytes
+        num_threads: Number of intra-op CPU threads (torch default if None)
+        padding_side: Tokenizer padding side (tokenizer default if None)
+
+    Returns:
+        A (model, tokenizer) pair with the model in eval mode
+    """
+    if quantize not in (None, 'int8'):
+        raise ValueError(f'Unknown quantization {quantize}. Supported values are: int8')
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    device = resolve_device(device)
+    torch_dtype = resolve_dtype(dtype, device)
+    start = time.perf_counter()
+
+    tokenizer_kwargs = {'padding_side': padding_side} if padding_side else {}
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True, **tokenizer_kwargs)
+
+    # low_cpu_mem_usage loads weights straight into the model (memory-mapped for
+    # safetensors checkpoints) instead of materializing a second copy first
+    model_kwargs = dict(trust_remote_code=True, low_cpu_mem_usage=True)
+    if quantize == 'int8' and device.startswith('cuda'):
+        from transformers import BitsAndBytesConfig
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, quantization_config=BitsAndBytesConfig(load_in_8bit=True),
+            device_map={'': device}, torch_dtype=torch_dtype, **model_kwargs)
+    elif quantize == 'int8':
+        if device != 'cpu':
+            raise ValueError(f'int8 quantization is only supported on CPU or CUDA, not {device}')
+        # Dynamic quantization works on float32 weights
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32, **model_kwargs)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch_dtype, **model_kwargs).to(device)
+    model.eval()
+
+    print(f'Loaded {model_name} on {device} ({quantize or torch_dtype}, {torch.get_num_threads()} CPU threads) '
+          f'in {time.perf_counter() - start:.1f}s; resident memory {resident_memory_mb():.0f} MB')
+    return model, tokenizer
+
+
+def shared_causal_lm(model_name: str, device: str = 'auto', dtype: str = 'auto', quantize: Optional[str] = None,
+                     num_threads: Optional[int] = None, owner: Optional[object] = None) -> ModelHandle:
+    """Reference to a (model, tokenizer) pair shared by every caller in the process.
+
+    The pair is loaded by `load_causal_lm` on the first `handle.get()`. Device and dtype
+    are resolved before keying, so e.g. 'auto' and 'cpu' share one copy on a CPU host.
+    The tokenizer pads on the left; single-sequence callers are unaffected by that.
+    """
+    resolved_device = resolve_device(device)
+    key = ('causal_lm', model_name, resolved_device, str(resolve_dtype(dtype, resolved_device)), quantize)
+    loader = lambda: load_causal_lm(model_name, device=resolved_device, dtype=dtype, quantize=quantize,
+                                    num_threads=num_threads)
+    return get_model_registry().acquire(key, loader, owner=owner)
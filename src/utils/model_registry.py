@@ -0,0 +1,83 @@
+import threading
+import weakref
+from typing import Callable, Dict, Hashable, Optional
+
+
+class ModelHandle:
+    """A shared, lazily loaded model held by the registry.
+
+    `get()` loads the model on first use; every holder shares that one instance.
+    """
+
+    def __init__(self, registry: 'ModelRegistry', key: Hashable, loader: Callable[[], object]):
+        self.key = key
+        self.refs = 0
+        self._registry = registry
+        self._loader = loader
+        self._value = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._loader()
+        return self._value
+
+    def release(self) -> None:
+        self._registry.release(self)
+
+
+class ModelRegistry:
+    """Process-wide registry of loaded models, keyed by e.g. (model name, device, dtype).
+
+    Holders acquire a reference-counted handle; the model is loaded the first time any
+    holder needs it and dropped when the last holder releases it, so instantiating many
+    agents costs one copy of each model.
+    """
+
+    def __init__(self):
+        self._handles: Dict[Hashable, ModelHandle] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: Hashable, loader: Callable[[], object], owner: Optional[object] = None) -> ModelHandle:
+        """Take a reference to the model under `key`, registering `loader` if it is new.
+
+        Args:
+            key: Identity of the model, e.g. (model name, device, dtype)
+            loader: Zero-argument callable that loads the model; called at most once
+            owner: If given, the reference is released when `owner` is garbage collected
+
+        Returns:
+            The shared ModelHandle for `key`
+        """
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None:
+                handle = self._handles[key] = ModelHandle(self, key, loader)
+            handle.refs += 1
+        if owner is not None:
+            weakref.finalize(owner, handle.release)
+        return handle
+
+    def release(self, handle: ModelHandle) -> None:
+        with self._lock:
+            handle.refs -= 1
+            if handle.refs <= 0 and self._handles.get(handle.key) is handle:
+                del self._handles[handle.key]
+                handle._value = None
+
+    def stats(self) -> Dict[Hashable, Dict]:
+        with self._lock:
+            return {key: {'refs': handle.refs, 'loaded': handle.loaded} for key, handle in self._handles.items()}
+
+
+_registry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    return _registry
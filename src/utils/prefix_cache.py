@@ -0,0 +1,70 @@
+import copy
+from collections import OrderedDict
+from typing import Optional
+
+import torch
+
+
+def prefix_token_length(tokenizer, text: str, prefix: Optional[str], add_special_tokens: bool = True) -> int:
+    """Number of leading tokens of `text` that encode its static `prefix`.
+
+    `prefix` is the static part of the prompt; it may be wrapped in a chat template
+    inside `text`, so everything in `text` up to the end of `prefix` counts. Tokens
+    are compared one by one because a merge across the boundary can change the last
+    prefix token.
+    """
+    if not prefix:
+        return 0
+    end = text.find(prefix)
+    if end == -1:
+        return 0
+    end += len(prefix)
+    full_ids = tokenizer(text, add_special_tokens=add_special_tokens)["input_ids"]
+    prefix_ids = tokenizer(text[:end], add_special_tokens=add_special_tokens)["input_ids"]
+    length = 0
+    for a, b in zip(full_ids, prefix_ids):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+class PrefixKVCache:
+    """LRU store of past_key_values for prompt prefixes shared by many prompts.
+
+    Entries are keyed by the prefix token ids, so two prompts reuse the same
+    prefill only if their static preamble tokenizes identically. Only single
+    sequences are supported: with left padding a shared prefix sits at different
+    positions in each row of a batch.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _get_prefix_cache(self, model, prefix_ids: torch.Tensor):
+        key = tuple(prefix_ids[0].tolist())
+        past_key_values = self._entries.get(key)
+        if past_key_values is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return past_key_values
+        self.misses += 1
+        with torch.no_grad():
+            past_key_values = model(input_ids=prefix_ids, use_cache=True).past_key_values
+        self._entries[key] = past_key_values
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return past_key_values
+
+    def generate(self, model, inputs, prefix_len: int, **generate_kwargs):
+        """`model.generate(**inputs, ...)`, starting from the cached prefill of the first `prefix_len` tokens."""
+        input_ids = inputs["input_ids"]
+        # At least one token has to be left for generate to prefill itself
+        if input_ids.shape[0] != 1 or prefix_len <= 0 or prefix_len >= input_ids.shape[1]:
+            return model.generate(**inputs, **generate_kwargs)
+        past_key_values = self._get_prefix_cache(model, input_ids[:, :prefix_len])
+        # generate extends the cache in place, so each call works on its own copy
+        return model.generate(**inputs, past_key_values=copy.deepcopy(past_key_values), **generate_kwargs)
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Optional, Callable, Dict, Any
+
+DEFAULT_CACHE_PATH = os.environ.get("LLM_RESPONSE_CACHE_PATH", ".cache/llm_responses.sqlite")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+class ResponseCache:
+    """On-disk, content-addressed cache of LLM responses backed by SQLite.
+
+    Entries are keyed by a hash of (backend, model, rendered prompt, temperature,
+    max_tokens). Identical requests that are in flight at the same time are
+    coalesced into one call, and once the stored responses exceed `max_bytes`
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[str, asyncio.Future] = {}
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(backend: str, model: str, prompt: Any, temperature: float, max_tokens: int) -> str:
+        payload = json.dumps([backend, model, prompt, temperature, max_tokens], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get_locked(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            response = self._get_locked(key)
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return response
+
+    def put(self, key: str, response: Optional[str]) -> None:
+        # Failed calls come back as None and are never cached
+        if response is None:
+            return
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                               (key, response, size, time.time()))
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict_locked()
+
+    def _evict_locked(self):
+        # Evict least recently used entries down to 90% of the budget so eviction is not run on every put
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Optional[str]]) -> Optional[str]:
+        """Return the cached response for `key`, or call `compute` once even if several threads ask at once."""
+        with self._lock:
+            response = self._get_locked(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            response = compute()
+            self.put(key, response)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Any]) -> Optional[str]:
+        """Async counterpart of `get_or_compute`; `compute` returns an awaitable."""
+        with self._lock:
+            response = self._get_locked(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            future = self._ainflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._ainflight[key] = asyncio.get_running_loop().create_future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return await asyncio.shield(future)
+        try:
+            response = await compute()
+            self.put(key, response)
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; retrieve the exception so asyncio does not warn about it
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._ainflight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "entries": entries, "bytes": self._total_bytes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[ResponseCache] = None
+# Off for library users unless opted in with LLM_RESPONSE_CACHE=1 or configure_response_cache();
+# main.py enables it (--cache-path, --no-cache)
+_default_cache_enabled = os.environ.get("LLM_RESPONSE_CACHE", "") == "1"
+_default_cache_lock = threading.Lock()
+
+
+def configure_response_cache(path: Optional[str] = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES) -> Optional[ResponseCache]:
+    """Set the process-wide response cache; pass path=None to disable caching."""
+    global _default_cache, _default_cache_enabled
+    with _default_cache_lock:
+        if _default_cache is not None:
+            _default_cache.close()
+        _default_cache_enabled = path is not None
+        _default_cache = ResponseCache(path, max_bytes) if path is not None else None
+        return _default_cache
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide response cache: the configured one, or one at DEFAULT_CACHE_PATH if LLM_RESPONSE_CACHE=1; else None."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None and _default_cache_enabled:
+            _default_cache = ResponseCache()
+        return _default_cache
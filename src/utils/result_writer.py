@@ -0,0 +1,127 @@
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Set, Tuple
+
+
+def _repair_tail(path: Path):
+    """Drop a partially written last line left behind by a crash."""
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        # Walk back to the last complete line
+        pos = size - 1
+        chunk = 4096
+        while pos > 0:
+            start = max(0, pos - chunk)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b'\n')
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return
+            pos = start
+        f.truncate(0)
+
+
+class ResultWriter:
+    """Stream result records to per-task/per-dataset JSONL files as they are produced.
+
+    Each (task, dataset) pair gets its own `{task}_{dataset}_samples{n}_{timestamp}.jsonl`
+    file. Lines are flushed after every write and fsync'ed every `fsync_every`
+    records or `fsync_interval` seconds, whichever comes first. With `resume=True`
+    the most recent existing file for a (task, dataset) pair is appended to instead,
+    and `completed_keys` reports which examples it already contains.
+    """
+
+    def __init__(self, output_dir: str = "synthesized", num_samples: int = 1, resume: bool = False,
+                 fsync_every: int = 50, fsync_interval: float = 10.0):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.num_samples = num_samples
+        self.resume = resume
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._paths: Dict[Tuple[str, str], Path] = {}
+        self._files = {}
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def path(self, task: str, dataset: str) -> Path:
+        key = (task, dataset)
+        if key not in self._paths:
+            # Dataset names such as 'CShorten/ML-ArXiv-Papers' must not create subdirectories
+            prefix = f"{task}_{dataset.replace('/', '_')}_samples{self.num_samples}_"
+            existing = sorted(self.output_dir.glob(f"{prefix}*.jsonl")) if self.resume else []
+            self._paths[key] = existing[-1] if existing else self.output_dir / f"{prefix}{self.timestamp}.jsonl"
+        return self._paths[key]
+
+    def completed_keys(self, task: str, dataset: str) -> Set[Tuple[str, str, str]]:
+        """(dataset, user_id, article_id) keys already written for this task and dataset.
+
+        The file is compacted first: records of failed edits are dropped (their examples are
+        retried) and a key written more than once keeps only its last successful record, so
+        the file never holds duplicate keys.
+        """
+        path = self.path(task, dataset)
+        if not self.resume or not path.exists():
+            return set()
+        _repair_tail(path)
+        records = {}
+        num_lines = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                num_lines += 1
+                record = json.loads(line)
+                key = (record["dataset"], record["user_id"], record["article_id"])
+                if record.get("edit_output") is not None:
+                    records.pop(key, None)
+                    records[key] = line
+        if len(records) < num_lines and path not in self._files:
+            tmp_path = path.with_name(path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(records.values())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        return set(records)
+
+    def write(self, task: str, record: dict):
+        path = self.path(task, record["dataset"])
+        f = self._files.get(path)
+        if f is None:
+            if path.exists():
+                _repair_tail(path)
+            f = self._files[path] = open(path, 'a', encoding='utf-8')
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        for path, f in self._files.items():
+            f.close()
+            print(f"Saved results to {path}")
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
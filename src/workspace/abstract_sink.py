@@ -5,6 +5,11 @@ class Sink(ABC):
     def log(self, metrics):
         ...
 
+    def log_many(self, metrics_list):
+        # Sinks that can send several records at once override this
+        for metrics in metrics_list:
+            self.log(metrics)
+
     @abstractmethod
     def log_artifacts(self, name, type, files):
         ...
@@ -14,4 +19,4 @@ class Sink(ABC):
         ...
 
     def __del__(self):
-        self.stop()  
\ No newline at end of file
+        self.stop()  
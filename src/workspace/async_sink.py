@@ -0,0 +1,119 @@
+import atexit
+import threading
+import time
+from collections import deque
+
+from src.workspace.abstract_sink import Sink
+
+OVERFLOW_POLICIES = ('coalesce', 'drop')
+
+# Key under which each record's time in the queue (in seconds) is sent along with it
+LATENCY_KEY = 'sink.queue_latency'
+
+class AsyncSink(Sink):
+    """
+    Wraps a sink so that `log` only queues the metrics; a background thread drains the queue in
+    batches of up to `batch_size`, handing each batch to the wrapped sink's `log_many`. Whether a
+    batch then goes out in one write depends on the sink: FileSink writes it at once, WandbSink
+    still makes one `run.log` call per record (one wandb step each), now off the agent loop.
+
+    Once `high_water` records are queued (e.g. the tracking server is slow or unreachable),
+    new records are either merged into the last queued one ('coalesce': later values win) or
+    dropped ('drop'), so `log` never blocks. Errors of the wrapped sink are printed and counted
+    instead of raised. Each sent record carries its time in the queue under LATENCY_KEY, and
+    `stats` summarizes queue latency, drops and errors. `stop` also runs at interpreter exit.
+    """
+    def __init__(self, sink, high_water = 10000, overflow = 'coalesce', batch_size = 64, report_latency = True):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy {overflow}. Supported values are: {list(OVERFLOW_POLICIES)}')
+        self.sink = sink
+        self.high_water = high_water
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.report_latency = report_latency
+        # (enqueue time, metrics)
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._sending = False
+        self._stopped = False
+        self._counts = {'queued': 0, 'sent': 0, 'coalesced': 0, 'dropped': 0, 'errors': 0}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._thread = threading.Thread(target=self._run, name='async-sink', daemon=True)
+        self._thread.start()
+        # Metrics still queued at exit are sent before the interpreter shuts down
+        atexit.register(self.stop)
+
+    def log(self, metrics):
+        with self._cond:
+            if self._stopped:
+                return
+            if len(self._pending) >= self.high_water:
+                if self.overflow == 'drop':
+                    self._counts['dropped'] += 1
+                    return
+                queued_at, last = self._pending[-1]
+                self._pending[-1] = (queued_at, dict(last, **metrics))
+                self._counts['coalesced'] += 1
+                return
+            self._pending.append((time.monotonic(), dict(metrics)))
+            self._counts['queued'] += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout = None):
+        """Wait until everything queued so far is sent; returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._sending, timeout)
+
+    def log_artifacts(self, name, type, files):
+        # Artifacts are logged at the end of a run, after its metrics
+        self.flush()
+        self.sink.log_artifacts(name, type, files)
+
+    def stop(self):
+        if getattr(self, '_stopped', True):
+            return
+        atexit.unregister(self.stop)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.sink.stop()
+
+    @property
+    def stats(self):
+        with self._cond:
+            sent = self._counts['sent']
+            return dict(
+                self._counts,
+                pending=len(self._pending),
+                latency_mean=self._latency_total / sent if sent else 0.0,
+                latency_max=self._latency_max)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stopped)
+                if not self._pending:
+                    return
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                self._sending = True
+            now = time.monotonic()
+            latencies = [now - queued_at for queued_at, _ in batch]
+            records = [dict(metrics, **{LATENCY_KEY: latency}) if self.report_latency else metrics
+                       for latency, (_, metrics) in zip(latencies, batch)]
+            failed = False
+            try:
+                self.sink.log_many(records)
+            except Exception as e:
+                failed = True
+                print(f'Warning: {type(self.sink).__name__} failed to log {len(records)} records: {e}')
+            with self._cond:
+                self._sending = False
+                if failed:
+                    self._counts['errors'] += 1
+                else:
+                    self._counts['sent'] += len(records)
+                    self._latency_total += sum(latencies)
+                    self._latency_max = max(self._latency_max, *latencies)
+                self._cond.notify_all()
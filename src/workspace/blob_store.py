@@ -0,0 +1,181 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from src.workspace.log_writer import COMPRESSION_SUFFIXES
+
+# Strings at least this long are moved out of log records into the blob store
+DEFAULT_MIN_BLOB_CHARS = 256
+
+# JSON form of a pointer to a blob: {"$blob": "<sha256 hex>"}
+POINTER_KEY = '$blob'
+
+
+def blob_dir_for(log_path) -> Path:
+    """Blob store directory of a log: `<log>.blobs`, next to the (uncompressed) log path."""
+    name = Path(log_path).name
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if suffix and name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return Path(log_path).with_name(name + '.blobs')
+
+
+class BlobStore:
+    """
+    Content-addressed store of the texts in a log, keyed by their SHA-256.
+
+    Each distinct text is appended once to `blobs.bin`; `index.tsv` maps hashes to
+    (offset, length). Log records hold {"$blob": hash} pointers instead of the texts, so an
+    article or prompt repeated across thousands of records is stored once.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._data_path = self.root / 'blobs.bin'
+        self._index_path = self.root / 'index.tsv'
+        self._index: Optional[Dict[str, Tuple[int, int]]] = None
+        self._index_read = 0
+        self._data = None
+        self._index_file = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _load_index(self):
+        """Read index entries appended since the last call."""
+        if self._index is None:
+            self._index = {}
+        if not self._index_path.exists():
+            return
+        with open(self._index_path, 'rb') as f:
+            f.seek(self._index_read)
+            data = f.read()
+        # Only complete lines count: a writer may be in the middle of one
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode('utf-8').splitlines():
+            digest, offset, length = line.split('\t')
+            self._index[digest] = (int(offset), int(length))
+        self._index_read += end
+
+    def put(self, text: str) -> str:
+        """Store `text` unless it is stored already; returns its hash."""
+        digest = self.digest(text)
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            if digest not in self._index:
+                if self._data is None:
+                    self.root.mkdir(parents=True, exist_ok=True)
+                    self._data = open(self._data_path, 'ab')
+                    self._index_file = open(self._index_path, 'ab')
+                data = text.encode('utf-8')
+                offset = self._data.seek(0, 2)
+                # Data before its index entry, so readers never see an entry without its data
+                self._data.write(data)
+                self._data.flush()
+                self._index_file.write(f'{digest}\t{offset}\t{len(data)}\n'.encode('utf-8'))
+                self._index_file.flush()
+                self._index[digest] = (offset, len(data))
+                self._index_read = self._index_file.tell()
+        return digest
+
+    def get(self, digest: str) -> str:
+        with self._lock:
+            if self._index is None or digest not in self._index:
+                self._load_index()
+            offset, length = self._index[digest]
+            if self._reader is None:
+                self._reader = os.open(self._data_path, os.O_RDONLY)
+            return os.pread(self._reader, length, offset).decode('utf-8')
+
+    def dedupe(self, value, min_chars: int = DEFAULT_MIN_BLOB_CHARS):
+        """Copy of a JSON-like value with every string of at least `min_chars` replaced by a pointer."""
+        if isinstance(value, str):
+            return {POINTER_KEY: self.put(value)} if len(value) >= min_chars else value
+        if isinstance(value, dict):
+            return {key: self.dedupe(item, min_chars) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.dedupe(item, min_chars) for item in value]
+        return value
+
+    def resolve(self, value):
+        """Replace pointers in a loaded JSON value by lazy BlobRefs."""
+        if isinstance(value, dict):
+            if len(value) == 1 and POINTER_KEY in value:
+                return BlobRef(self, value[POINTER_KEY])
+            return {key: self.resolve(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        return value
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._data, self._index_file):
+                if f is not None:
+                    f.close()
+            self._data = self._index_file = None
+            if self._reader is not None:
+                os.close(self._reader)
+                self._reader = None
+
+    @property
+    def files(self):
+        return [path for path in (self._data_path, self._index_path) if path.exists()]
+
+
+class BlobRef:
+    """A text in a BlobStore, read on first use; behaves like the string for printing, slicing and comparing."""
+    __slots__ = ('_store', 'digest', '_text')
+
+    def __init__(self, store: BlobStore, digest: str):
+        self._store = store
+        self.digest = digest
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._store.get(self.digest)
+        return self._text
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f'BlobRef({self.digest[:12]})'
+
+    def __len__(self):
+        return len(self.text)
+
+    def __getitem__(self, item):
+        return self.text[item]
+
+    def __eq__(self, other):
+        if isinstance(other, BlobRef):
+            return self.digest == other.digest
+        return self.text == other
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __getattr__(self, name):
+        # str methods (split, startswith, ...) act on the text
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.text, name)
+
+
+def materialize(value):
+    """Copy of a value with every BlobRef replaced by its text."""
+    if isinstance(value, BlobRef):
+        return value.text
+    if isinstance(value, dict):
+        return {key: materialize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [materialize(item) for item in value]
+    return value
@@ -0,0 +1,42 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from src.workspace.abstract_sink import Sink
+
+class FileSink(Sink):
+    """
+    Offline stand-in for WandbSink: each run is a directory `<root>/<project>/<run id>/` holding
+    the run parameters (params.json), one JSON line per metrics record (metrics.ndjson) and
+    copies of the logged artifacts (artifacts/<name>/).
+    """
+    def __init__(self, root, project, params):
+        self.run_dir = Path(root) / project / f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}'
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.run_dir / 'params.json', 'w') as f:
+            json.dump(params, f, indent=2, default=str)
+        self._file = open(self.run_dir / 'metrics.ndjson', 'a')
+        self._step = 0
+
+    def log(self, metrics):
+        self.log_many([metrics])
+
+    def log_many(self, metrics_list):
+        lines = []
+        for metrics in metrics_list:
+            lines.append(json.dumps(dict(metrics, _step=self._step), default=str))
+            self._step += 1
+        self._file.write(''.join(f'{line}\n' for line in lines))
+        self._file.flush()
+
+    def log_artifacts(self, name, type, files):
+        artifact_dir = self.run_dir / 'artifacts' / name
+        artifact_dir.mkdir(parents=True, exist_ok=True)
+        for f in files:
+            shutil.copy2(f, artifact_dir / Path(f).name)
+
+    def stop(self):
+        if getattr(self, '_file', None) is not None and not self._file.closed:
+            self._file.close()
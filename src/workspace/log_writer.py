@@ -0,0 +1,173 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
+
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+FSYNC_POLICIES = ('never', 'close', 'batch')
+
+_STOP = object()
+
+
+def log_part_path(path, part: int) -> Path:
+    """Path of the `part`-th file of a rotated log: the log itself, then `<log>.1`, `<log>.2`, ..."""
+    path = Path(path)
+    if part == 0:
+        return path
+    name, compression_suffix = path.name, ''
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if suffix and name.endswith(suffix):
+            name, compression_suffix = name[:-len(suffix)], suffix
+    stem, suffix = os.path.splitext(name)
+    return path.with_name(f'{stem}.{part}{suffix}{compression_suffix}')
+
+
+def log_files(path) -> List[Path]:
+    """All existing files of a (possibly rotated) log, in write order."""
+    files = []
+    while log_part_path(path, len(files)).exists():
+        files.append(log_part_path(path, len(files)))
+    return files
+
+
+def open_log_file(path, mode: str = 'rt'):
+    """Open a log file for reading, decompressing .gz/.zst files."""
+    path = str(path)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8')
+    if path.endswith('.zst'):
+        import io
+        import zstandard
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True),
+                                encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class LogWriter:
+    """
+    Writes JSON records as ndjson from a background thread.
+
+    `write` serializes the record and enqueues it, blocking if more than `queue_size` records
+    are pending; the writer thread writes them in batches of up to `batch_size`.
+    The stream can be gzip or zstd compressed, and is rotated to a new part (see
+    `log_part_path`) once a part exceeds `max_bytes`. `fsync` is 'never', 'close' (once, on
+    close) or 'batch' (after every batch). `close` writes everything still queued; it also runs
+    at interpreter exit if the writer is still open.
+    `transform`, if given, is applied to each record on the writer thread before it is written.
+    """
+
+    def __init__(self, path, compression: Optional[str] = None, max_bytes: Optional[int] = None,
+                 fsync: str = 'close', queue_size: int = 1024, batch_size: int = 64,
+                 transform: Optional[Callable[[dict], dict]] = None):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f'Unknown log compression {compression}. Supported values are: gzip, zstd')
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'Unknown fsync policy {fsync}. Supported values are: {list(FSYNC_POLICIES)}')
+        self.path = self.compressed_path(path, compression)
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.transform = transform
+        self.files: List[Path] = []
+        # Appends to the last part of an existing log (compressed streams are concatenated)
+        self._part = max(0, len(log_files(self.path)) - 1)
+        self._raw = None
+        self._stream = None
+        self._part_bytes = 0
+        self._error: Optional[BaseException] = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name=f'log-writer-{self.path.name}', daemon=True)
+        self._thread.start()
+        # Records still queued at exit would otherwise die with the daemon thread
+        atexit.register(self.close)
+
+    @staticmethod
+    def compressed_path(path, compression: Optional[str]) -> Path:
+        """Path the log is written to: `path` with .gz/.zst appended for compressed logs."""
+        path = Path(path)
+        return path.with_name(path.name + COMPRESSION_SUFFIXES[compression])
+
+    def write(self, record: dict) -> None:
+        self._raise_error()
+        # Serialized now, so later changes to the caller's dict don't change what is logged
+        self._queue.put(json.dumps(record))
+
+    def close(self) -> None:
+        """Write all queued records, close the file and stop the writer thread."""
+        atexit.unregister(self.close)
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError(f'Writing log {self.path} failed') from self._error
+
+    def _open_part(self):
+        path = log_part_path(self.path, self._part)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._raw = open(path, 'ab')
+        if self.compression == 'gzip':
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode='ab')
+        elif self.compression == 'zstd':
+            import zstandard
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+        self._part_bytes = 0
+        self.files.append(path)
+
+    def _close_part(self, sync: bool):
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        if sync:
+            os.fsync(self._raw.fileno())
+        self._raw.close()
+        self._raw = self._stream = None
+
+    def _write_batch(self, lines: List[str]):
+        if self._raw is None:
+            self._open_part()
+        if self.transform is not None:
+            lines = [json.dumps(self.transform(json.loads(line))) for line in lines]
+        data = ''.join(f'{line}\n' for line in lines).encode('utf-8')
+        self._stream.write(data)
+        self._stream.flush()
+        self._raw.flush()
+        if self.fsync == 'batch':
+            os.fsync(self._raw.fileno())
+        # Rotation counts uncompressed bytes, so parts hold a predictable amount of log
+        self._part_bytes += len(data)
+        if self.max_bytes and self._part_bytes >= self.max_bytes:
+            self._close_part(sync=self.fsync != 'never')
+            self._part += 1
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                stop = True
+                batch.pop()
+            if batch and self._error is None:
+                try:
+                    self._write_batch(batch)
+                except BaseException as e:
+                    self._error = e
+        if self._raw is not None:
+            try:
+                self._close_part(sync=self.fsync != 'never')
+            except BaseException as e:
+                self._error = self._error or e
@@ -9,6 +9,11 @@ class WandbSink(Sink):
     def log(self, metrics):
         self.run.log(metrics)
 
+    def log_many(self, metrics_list):
+        # One run.log per record keeps one wandb step per record; wandb uploads them in the background
+        for metrics in metrics_list:
+            self.run.log(metrics)
+
     def log_artifacts(self, name, type, files):
         import wandb
         artifact = wandb.Artifact(name, type=type)
@@ -16,4 +21,7 @@ class WandbSink(Sink):
         self.run.log_artifact(artifact)
 
     def stop(self):
-        self.run.finish()
\ No newline at end of file
+        # Called by Workspace.stop and again on garbage collection
+        if getattr(self, 'run', None) is not None:
+            self.run.finish()
+            self.run = None
\ No newline at end of file
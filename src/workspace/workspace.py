@@ -1,7 +1,12 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
+import shutil
 
+from src.workspace.async_sink import AsyncSink
 from src.workspace.dummy_sink import DummySink
+from src.workspace.blob_store import BlobStore, DEFAULT_MIN_BLOB_CHARS, blob_dir_for
+from src.workspace.file_sink import FileSink
+from src.workspace.log_writer import LogWriter, log_files
 from src.workspace.wandb_sink import WandbSink
 
 
@@ -9,12 +14,25 @@ def _get_sink(workspace_config, user_config, agent_config, task_config):
     if workspace_config.sink == 'dummy':
         return DummySink()
     elif workspace_config.sink == 'wandb':
-        return WandbSink(
+        sink = WandbSink(
             project=workspace_config.project,
             params=_get_params(user_config, agent_config, task_config, workspace_config),
             src_path=workspace_config.src_path)
+    elif workspace_config.sink == 'file':
+        sink = FileSink(
+            root=getattr(workspace_config, 'sink_dir', None) or Path(workspace_config.log_folder) / 'runs',
+            project=workspace_config.project,
+            params=_get_params(user_config, agent_config, task_config, workspace_config))
     else:
         raise ValueError(f'Unknown sink implementation {workspace_config.sink}')
+    # Metrics are sent from a background thread so a slow tracking backend can't stall the run
+    if not getattr(workspace_config, 'sink_async', True):
+        return sink
+    return AsyncSink(
+        sink,
+        high_water=getattr(workspace_config, 'sink_high_water', 10000),
+        overflow=getattr(workspace_config, 'sink_overflow', 'coalesce'),
+        batch_size=getattr(workspace_config, 'sink_batch_size', 64))
 
 
 def _get_params(user_config, agent_config, task_config, workspace_config):
@@ -80,26 +98,47 @@ class Workspace:
         
         self.conversation_log = []
         self.log_level = workspace_config.log_level
-        if self.log_path.exists():
-            self.log_path.unlink()
+
+        # Records are written by a background thread; see LogWriter for the options
+        compression = getattr(workspace_config, 'log_compression', None)
+        # Without compression both lists name the same files
+        for path in set(log_files(self.log_path) + log_files(LogWriter.compressed_path(self.log_path, compression))):
+            path.unlink(missing_ok=True)
+
+        # Long texts (articles, prompts, responses) are stored once in a content-addressed
+        # blob store next to the log, and records point at them by hash
+        self._blob_store = None
+        transform = None
+        if getattr(workspace_config, 'log_blobs', True):
+            blob_dir = blob_dir_for(self.log_path)
+            if blob_dir.exists():
+                shutil.rmtree(blob_dir)
+            self._blob_store = BlobStore(blob_dir)
+            min_chars = getattr(workspace_config, 'log_blob_min_chars', DEFAULT_MIN_BLOB_CHARS)
+            transform = lambda record: self._blob_store.dedupe(record, min_chars)
+        self._log_writer = LogWriter(
+            self.log_path,
+            compression=compression,
+            max_bytes=getattr(workspace_config, 'log_max_bytes', None),
+            fsync=getattr(workspace_config, 'log_fsync', 'close'),
+            queue_size=getattr(workspace_config, 'log_queue_size', 1024),
+            batch_size=getattr(workspace_config, 'log_batch_size', 64),
+            transform=transform)
 
     def log(self, metrics):
-        import json
         self.sink.log(metrics)
-        try:
-            # Ensure directory exists before writing
-            self.log_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.log_path, 'a') as f:
-                f.write(f'{json.dumps(dict(metrics, conversation = self.conversation_log))}\n')
-        except Exception as e:
-            print(f"Error writing to log file: {e}")
-            print(f"log_path: {self.log_path}")
-            print(f"log_path parent exists: {self.log_path.parent.exists()}")
-            raise
+        self._log_writer.write(dict(metrics, conversation = self.conversation_log))
         self.conversation_log = []
 
     def log_message(self, request, llm_name, response):
         self.conversation_log.append({'q': request, llm_name: response})
 
     def stop(self):
-        self.sink.log_artifacts('logs', 'logs', [self.log_path])
+        # Flush everything still queued before the log files are uploaded
+        self._log_writer.close()
+        files = self._log_writer.files or [self._log_writer.path]
+        if self._blob_store is not None:
+            self._blob_store.close()
+            files = files + self._blob_store.files
+        self.sink.log_artifacts('logs', 'logs', files)
+        self.sink.stop()
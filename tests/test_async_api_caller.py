@@ -0,0 +1,104 @@
+"""AsyncAPIModelCaller against a local stand-in for the OpenAI chat completions endpoint."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+
+from src.utils.async_api_caller import AsyncAPIModelCaller
+from src.utils.response_cache import configure_response_cache
+
+
+class StandInServer:
+    """Answers every chat completion with "echo: <prompt>", after failing the first `failures` requests with 429."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests += 1
+                    fail = server.requests <= server.failures
+                if fail:
+                    self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"retry-after": "0"})
+                    return
+                prompt = body["messages"][0]["content"] if body["messages"] else ""
+                self._send(200, {
+                    "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": f"echo: {prompt}"}}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                })
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache():
+    configure_response_cache(None)
+    yield
+
+
+@pytest.fixture
+def server():
+    server = StandInServer()
+    yield server
+    server.close()
+
+
+def test_batch_returns_responses_in_order(server):
+    caller = AsyncAPIModelCaller(api_key="test", base_url=server.base_url, max_concurrency=4)
+    prompts = [f"prompt {i}" for i in range(20)]
+    assert caller.batch(prompts) == [f"echo: {prompt}" for prompt in prompts]
+    assert caller("hello") == "echo: hello"
+    assert caller.latency_stats()["count"] == 21
+
+
+def test_retries_refund_the_token_budget(server):
+    server.failures = 3
+    caller = AsyncAPIModelCaller(api_key="test", base_url=server.base_url, max_tokens=1000,
+                                 tokens_per_minute=10000, max_retries=5)
+    assert caller("hello") == "echo: hello"
+    assert server.requests == 4
+    # Only the successful attempt's 2 tokens are spent, not four reservations of ~1000
+    assert caller._token_bucket._tokens > 10000 - 100
+
+
+def test_gives_up_after_max_retries(server):
+    server.failures = 10
+    caller = AsyncAPIModelCaller(api_key="test", base_url=server.base_url, max_retries=2)
+    assert caller("hello") is None
+    assert server.requests == 3
+
+
+def test_missing_api_key_returns_none(server, capsys):
+    caller = AsyncAPIModelCaller(api_key=None, base_url=server.base_url)
+    assert caller("hello") is None
+    assert "OpenAI client not initialized" in capsys.readouterr().out
+    assert server.requests == 0
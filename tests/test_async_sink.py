@@ -0,0 +1,116 @@
+"""AsyncSink back-pressure (coalesce/drop at the high-water mark) and FileSink output."""
+import json
+import threading
+
+import pytest
+
+from src.workspace.abstract_sink import Sink
+from src.workspace.async_sink import LATENCY_KEY, AsyncSink
+from src.workspace.file_sink import FileSink
+
+
+class BlockingSink(Sink):
+    """Records batches; blocks in log_many until released, so records pile up in the queue."""
+
+    def __init__(self):
+        self.batches = []
+        self.artifacts = []
+        self.stopped = False
+        self.release = threading.Event()
+        self.entered = threading.Event()
+
+    def log(self, metrics):
+        self.log_many([metrics])
+
+    def log_many(self, metrics_list):
+        self.entered.set()
+        self.release.wait()
+        self.batches.append(list(metrics_list))
+
+    def log_artifacts(self, name, type, files):
+        self.artifacts.append((name, type, files))
+
+    def stop(self):
+        self.stopped = True
+
+    @property
+    def records(self):
+        return [record for batch in self.batches for record in batch]
+
+
+def _fill(sink, inner, count):
+    # The first record is taken by the worker, which then blocks; the rest stay queued
+    sink.log({"i": 0})
+    assert inner.entered.wait(5)
+    for i in range(1, count):
+        sink.log({"i": i, "step": i})
+
+
+def test_coalesces_at_high_water_mark():
+    inner = BlockingSink()
+    sink = AsyncSink(inner, high_water=3, overflow="coalesce", batch_size=2)
+    _fill(sink, inner, 10)
+    stats = sink.stats
+    assert stats["pending"] == 3 and stats["coalesced"] == 6 and stats["dropped"] == 0
+    inner.release.set()
+    sink.stop()
+    assert inner.stopped
+    # Records 4..9 were merged into record 3: later values win
+    assert [record["i"] for record in inner.records] == [0, 1, 2, 9]
+    assert all(len(batch) <= 2 for batch in inner.batches)
+    assert all(record[LATENCY_KEY] >= 0 for record in inner.records)
+    assert sink.stats["sent"] == 4
+
+
+def test_drops_at_high_water_mark():
+    inner = BlockingSink()
+    sink = AsyncSink(inner, high_water=3, overflow="drop", report_latency=False)
+    _fill(sink, inner, 10)
+    assert sink.stats["dropped"] == 6
+    inner.release.set()
+    sink.stop()
+    assert inner.records == [{"i": 0}, {"i": 1, "step": 1}, {"i": 2, "step": 2}, {"i": 3, "step": 3}]
+
+
+def test_log_does_not_block_and_artifacts_follow_metrics():
+    inner = BlockingSink()
+    sink = AsyncSink(inner, high_water=100)
+    _fill(sink, inner, 50)
+    assert sink.stats["pending"] == 49
+    inner.release.set()
+    sink.log_artifacts("logs", "logs", ["a.ndjson"])
+    assert len(inner.records) == 50 and inner.artifacts == [("logs", "logs", ["a.ndjson"])]
+    sink.stop()
+    sink.stop()
+
+
+def test_errors_are_counted_not_raised(capsys):
+    class FailingSink(BlockingSink):
+        def log_many(self, metrics_list):
+            raise IOError("offline")
+    sink = AsyncSink(FailingSink())
+    sink.log({"i": 0})
+    assert sink.flush(5)
+    assert sink.stats["errors"] == 1 and sink.stats["sent"] == 0
+    assert "offline" in capsys.readouterr().out
+    sink.stop()
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        AsyncSink(BlockingSink(), overflow="block")
+
+
+def test_file_sink_writes_run_directory(tmp_path):
+    artifact = tmp_path / "log.ndjson"
+    artifact.write_text("{}\n")
+    sink = AsyncSink(FileSink(tmp_path / "runs", "proj", {"agent.model": "m"}))
+    for i in range(5):
+        sink.log({"cost": i})
+    sink.log_artifacts("logs", "logs", [artifact])
+    sink.stop()
+    run_dir, = (tmp_path / "runs" / "proj").iterdir()
+    assert json.loads((run_dir / "params.json").read_text()) == {"agent.model": "m"}
+    records = [json.loads(line) for line in (run_dir / "metrics.ndjson").read_text().splitlines()]
+    assert [(r["cost"], r["_step"]) for r in records] == [(i, i) for i in range(5)]
+    assert (run_dir / "artifacts" / "logs" / "log.ndjson").read_text() == "{}\n"
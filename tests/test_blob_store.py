@@ -0,0 +1,68 @@
+"""BlobStore: deduplication of long log texts and their resolution when logs are read."""
+import json
+
+import pytest
+
+from src.workspace.blob_store import BlobRef, BlobStore, POINTER_KEY, blob_dir_for, materialize
+
+
+def test_blob_dir_sits_next_to_the_uncompressed_log(tmp_path):
+    assert blob_dir_for(tmp_path / "run.ndjson.gz") == tmp_path / "run.ndjson.blobs"
+
+
+def test_dedupe_stores_each_long_text_once(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    article = "a" * 300
+    record = {"message": article, "short": "hi", "conversation": [{"q": article, "a": "b" * 300}], "cost": 3}
+    deduped = store.dedupe(record, min_chars=256)
+    assert deduped["short"] == "hi" and deduped["cost"] == 3
+    assert deduped["message"] == {POINTER_KEY: store.digest(article)}
+    assert deduped["conversation"][0]["q"] == deduped["message"]
+    store.dedupe(record, min_chars=256)
+    store.close()
+    # Two distinct texts, however often they were logged
+    assert (tmp_path / "blobs" / "blobs.bin").stat().st_size == 600
+    assert len((tmp_path / "blobs" / "index.tsv").read_text().splitlines()) == 2
+
+    reopened = BlobStore(tmp_path / "blobs")
+    resolved = reopened.resolve(json.loads(json.dumps(deduped)))
+    assert isinstance(resolved["message"], BlobRef)
+    assert resolved["message"] == article
+    assert materialize(resolved) == record
+
+
+def test_blob_ref_acts_like_its_text(tmp_path):
+    store = BlobStore(tmp_path)
+    ref = BlobRef(store, store.put("hello world"))
+    assert str(ref) == "hello world"
+    assert ref[:5] == "hello" and len(ref) == 11
+    assert ref.split() == ["hello", "world"]
+
+
+def test_row_resolves_blob_refs(tmp_path):
+    pytest.importorskip("diff_match_patch")
+    from src.utils.logs import Row
+    store = BlobStore(tmp_path)
+    article = "x" * 300
+    row = Row(store.resolve(store.dedupe({"message": article, "cost": 1}, min_chars=256)))
+    assert row["message"] == article and isinstance(row["message"], str)
+    assert row["cost"] == 1
+    assert str(row).startswith("Cost: 1--------xxx")
+
+
+def test_logs_load_resolves_blob_refs(tmp_path):
+    pytest.importorskip("pandas")
+    pytest.importorskip("diff_match_patch")
+    from src.utils.logs import Logs
+    from src.workspace.log_writer import LogWriter
+    path = tmp_path / "run.ndjson"
+    store = BlobStore(blob_dir_for(path))
+    writer = LogWriter(path, compression="gzip", transform=lambda record: store.dedupe(record, 256))
+    for i in range(3):
+        writer.write({"message": "m" * 300, "cost": i})
+    writer.close()
+    store.close()
+
+    logs = Logs.load(writer.path)
+    assert list(logs["cost"]) == [0, 1, 2]
+    assert all(str(message) == "m" * 300 for message in logs["message"])
@@ -0,0 +1,43 @@
+"""EmbeddingStore: persistence across reopen."""
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("numpy")
+
+from src.agent.encoders.embedding_store import EmbeddingStore
+
+
+def test_write_reopen_round_trip(tmp_path):
+    vectors = torch.arange(12, dtype=torch.float32).reshape(3, 4)
+    store = EmbeddingStore(tmp_path, "bert")
+    assert store.get("a") is None
+    store.put_many(["a", "b", "c"], vectors)
+    store.put("a", torch.zeros(4))  # already stored: ignored
+    assert torch.equal(store.get("b"), vectors[1])
+
+    reopened = EmbeddingStore(tmp_path, "bert", lru_size=1)
+    assert reopened.dim == 4
+    for text, vector in zip(["a", "b", "c"], vectors):
+        assert torch.equal(reopened.get(text), vector)
+    assert reopened.get("d") is None
+    assert (tmp_path / "bert" / "vectors.f32").stat().st_size == 3 * 4 * 4
+
+
+def test_rows_written_by_another_instance_are_picked_up(tmp_path):
+    reader = EmbeddingStore(tmp_path, "mpnet")
+    writer = EmbeddingStore(tmp_path, "mpnet")
+    assert reader.get("x") is None
+    writer.put("x", torch.ones(3))
+    assert torch.equal(reader.get("x"), torch.ones(3))
+
+
+def test_torn_row_is_dropped_on_open(tmp_path):
+    store = EmbeddingStore(tmp_path, "bert")
+    store.put_many(["a", "b"], torch.ones(2, 4))
+    # A crash after the vector append but before the key append
+    with open(tmp_path / "bert" / "vectors.f32", "ab") as f:
+        f.write(b"\0" * 10)
+    reopened = EmbeddingStore(tmp_path, "bert")
+    assert (tmp_path / "bert" / "vectors.f32").stat().st_size == 2 * 4 * 4
+    reopened.put("c", torch.full((4,), 2.0))
+    assert torch.equal(EmbeddingStore(tmp_path, "bert").get("c"), torch.full((4,), 2.0))
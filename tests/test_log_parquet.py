@@ -0,0 +1,67 @@
+"""Parquet conversion of workspace logs and column/filter pushdown on load."""
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("pandas")
+pytest.importorskip("diff_match_patch")
+
+from src.utils.log_parquet import convert_logs_to_parquet, load_logs_parquet, parquet_path_for
+from src.workspace.blob_store import BlobStore, blob_dir_for
+from src.workspace.log_writer import LogWriter
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / "run.ndjson"
+    store = BlobStore(blob_dir_for(path))
+    writer = LogWriter(path, compression="gzip", max_bytes=2000,
+                       transform=lambda record: store.dedupe(record, 256))
+    for i in range(40):
+        writer.write({
+            "message": f"article {i % 4} " + "x" * 300,
+            "completion": f"completion {i}",
+            "cost": i % 5,
+            "accuracy": i / 40,
+            "is_edited": i % 2 == 0,
+            "completion_logprobs": [-0.5, -1.0, -i],
+            "conversation": [{"q": "y" * 300, "AgentLLM": f"answer {i}"}],
+        })
+    writer.close()
+    store.close()
+    return writer.path
+
+
+def test_parquet_path_replaces_log_suffixes(tmp_path):
+    assert parquet_path_for(tmp_path / "run.ndjson.gz") == tmp_path / "run.parquet"
+
+
+def test_round_trip_with_texts(log_path):
+    parquet_path = convert_logs_to_parquet(log_path, row_group_size=16)
+    assert parquet_path == log_path.with_name("run.parquet")
+    logs = load_logs_parquet(parquet_path, include_texts=True)
+    assert len(logs) == 40
+    row = logs.iloc[7]
+    assert row["message"] == "article 3 " + "x" * 300
+    assert row["completion"] == "completion 7"
+    assert row["cost"] == 2 and row["accuracy"] == 7 / 40 and not row["is_edited"]
+    assert list(row["completion_logprobs"]) == [-0.5, -1.0, -7.0]
+    assert row["conversation"] == [{"q": "y" * 300, "AgentLLM": "answer 7"}]
+
+
+def test_default_load_skips_text_columns(log_path):
+    logs = load_logs_parquet(convert_logs_to_parquet(log_path))
+    assert set(logs.columns) == {"cost", "accuracy", "is_edited", "completion_logprobs"}
+
+
+def test_columns_and_filters_are_pushed_down(log_path):
+    parquet_path = convert_logs_to_parquet(log_path)
+    logs = load_logs_parquet(parquet_path, columns=["cost", "completion"], filters=[("cost", "=", 4)])
+    assert list(logs.columns) == ["cost", "completion"]
+    assert list(logs["completion"]) == [f"completion {i}" for i in range(40) if i % 5 == 4]
+
+
+def test_logs_load_parquet(log_path):
+    from src.utils.logs import Logs
+    logs = Logs.load_parquet(convert_logs_to_parquet(log_path), columns=["cost"], filters=[("cost", ">", 2)])
+    assert isinstance(logs, Logs)
+    assert sorted(set(logs["cost"])) == [3, 4]
@@ -0,0 +1,67 @@
+"""LogWriter: rotation, gzip output and exit-time flushing."""
+import json
+from pathlib import Path
+
+from src.workspace.log_writer import LogWriter, log_files, log_part_path, open_log_file
+
+
+def _read(path):
+    records = []
+    for part in log_files(path):
+        with open_log_file(part) as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+def test_part_paths_keep_compression_suffix(tmp_path):
+    path = tmp_path / "run.v1.ndjson.gz"
+    assert log_part_path(path, 0) == path
+    assert log_part_path(path, 2) == tmp_path / "run.v1.2.ndjson.gz"
+
+
+def test_gzip_rotation_reads_back_in_order(tmp_path):
+    writer = LogWriter(tmp_path / "log.ndjson", compression="gzip", max_bytes=200, batch_size=1)
+    for i in range(50):
+        writer.write({"i": i, "text": "x" * 20})
+    writer.close()
+    assert writer.path == tmp_path / "log.ndjson.gz"
+    assert len(writer.files) > 1
+    assert writer.files == log_files(writer.path)
+    assert [record["i"] for record in _read(writer.path)] == list(range(50))
+
+
+def test_reopening_appends_to_last_part(tmp_path):
+    for start in (0, 10):
+        writer = LogWriter(tmp_path / "log.ndjson", compression="gzip")
+        for i in range(start, start + 10):
+            writer.write({"i": i})
+        writer.close()
+    assert [record["i"] for record in _read(writer.path)] == list(range(20))
+
+
+def test_record_is_snapshotted_on_write(tmp_path):
+    writer = LogWriter(tmp_path / "log.ndjson")
+    record = {"conversation": []}
+    writer.write(record)
+    record["conversation"].append("later")
+    writer.close()
+    assert _read(writer.path) == [{"conversation": []}]
+
+
+def test_transform_runs_before_writing(tmp_path):
+    writer = LogWriter(tmp_path / "log.ndjson", transform=lambda record: dict(record, seen=True))
+    writer.write({"i": 0})
+    writer.close()
+    assert _read(writer.path) == [{"i": 0, "seen": True}]
+
+
+def test_unclosed_writer_is_flushed_at_exit(tmp_path):
+    import subprocess
+    import sys
+    script = (
+        "from src.workspace.log_writer import LogWriter\n"
+        f"writer = LogWriter({str(tmp_path / 'log.ndjson')!r}, compression='gzip')\n"
+        "for i in range(1000):\n"
+        "    writer.write({'i': i})\n")
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=Path(__file__).resolve().parents[1])
+    assert [record["i"] for record in _read(tmp_path / "log.ndjson.gz")] == list(range(1000))
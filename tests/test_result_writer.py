@@ -0,0 +1,68 @@
+"""ResultWriter: crash-tail repair and resume."""
+import json
+
+from src.utils.result_writer import ResultWriter, _repair_tail
+
+
+def _record(article_id, edit_output="edited", user_id="u1"):
+    return {"dataset": "cnn_dailymail", "user_id": user_id, "article_id": article_id, "edit_output": edit_output}
+
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_repair_tail_drops_partial_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text(json.dumps(_record("a")) + "\n" + '{"dataset": "cnn_da')
+    _repair_tail(path)
+    assert _lines(path) == [_record("a")]
+
+
+def test_repair_tail_without_complete_line_empties_file(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"dataset"')
+    _repair_tail(path)
+    assert path.read_text() == ""
+
+
+def test_resume_appends_to_latest_file_and_skips_completed(tmp_path):
+    with ResultWriter(tmp_path, num_samples=2) as writer:
+        writer.write("summarization", _record("a"))
+        writer.write("summarization", _record("b"))
+    path = writer.path("summarization", "cnn_dailymail")
+    # A crash in the middle of the next line
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"dataset": "cnn_dailymail", "user_')
+
+    resumed = ResultWriter(tmp_path, num_samples=2, resume=True)
+    assert resumed.path("summarization", "cnn_dailymail") == path
+    assert resumed.completed_keys("summarization", "cnn_dailymail") == {
+        ("cnn_dailymail", "u1", "a"), ("cnn_dailymail", "u1", "b")}
+    resumed.write("summarization", _record("c"))
+    resumed.close()
+    assert [r["article_id"] for r in _lines(path)] == ["a", "b", "c"]
+
+
+def test_resume_retries_failed_edits_without_duplicates(tmp_path):
+    with ResultWriter(tmp_path, num_samples=2) as writer:
+        writer.write("summarization", _record("a"))
+        writer.write("summarization", _record("b", edit_output=None))
+        writer.write("summarization", _record("a", edit_output="edited again"))
+        writer.write("summarization", _record("a", edit_output=None))
+    path = writer.path("summarization", "cnn_dailymail")
+
+    resumed = ResultWriter(tmp_path, num_samples=2, resume=True)
+    assert resumed.completed_keys("summarization", "cnn_dailymail") == {("cnn_dailymail", "u1", "a")}
+    # Failed records are dropped and a key keeps its last successful record
+    assert _lines(path) == [_record("a", edit_output="edited again")]
+    resumed.write("summarization", _record("b"))
+    resumed.close()
+    assert [r["article_id"] for r in _lines(path)] == ["a", "b"]
+
+
+def test_without_resume_each_run_gets_a_new_file(tmp_path):
+    writer = ResultWriter(tmp_path, num_samples=2)
+    assert writer.completed_keys("summarization", "cnn_dailymail") == set()
+    assert not writer.path("summarization", "cnn_dailymail").exists()
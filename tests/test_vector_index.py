@@ -0,0 +1,41 @@
+"""VectorIndex: exact top-k against brute force, across buffer growth."""
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from src.agent.vector_index import VectorIndex
+
+
+def _brute_force(vectors, queries, topk):
+    return (queries @ vectors.T).topk(topk, dim=1)[1].tolist()
+
+
+def test_topk_matches_brute_force_past_initial_capacity():
+    torch.manual_seed(0)
+    vectors = torch.randn(100, 16)
+    index = VectorIndex(initial_capacity=4)
+    assert [index.add(vector) for vector in vectors] == list(range(100))
+    assert len(index) == 100
+    assert torch.equal(index.vectors, vectors)
+
+    queries = torch.randn(10, 16)
+    assert index.search_many(queries, topk=5) == _brute_force(vectors, queries, 5)
+    assert index.search(queries[0], topk=3) == _brute_force(vectors, queries[:1], 3)[0]
+
+
+def test_topk_is_capped_by_size():
+    index = VectorIndex()
+    assert index.search(torch.ones(4), topk=3) == []
+    index.add(torch.ones(4))
+    index.add(-torch.ones(4))
+    assert index.search(torch.ones(4), topk=5) == [0, 1]
+
+
+def test_search_between_adds_sees_new_rows():
+    torch.manual_seed(1)
+    index = VectorIndex(initial_capacity=2)
+    vectors = torch.randn(9, 8)
+    for i, vector in enumerate(vectors):
+        index.add(vector)
+        query = torch.randn(1, 8)
+        assert index.search_many(query, topk=2) == _brute_force(vectors[:i + 1], query, min(2, i + 1))